@@ -5,68 +5,75 @@
 # written in machine language to run on the HACK Computer(TECS).
 # Tested on both python 3.8.2 and 3.10.0
 
-def assembler_main(filename):
+def assembler_main(filename, asm_lines=None, rom_image=False):
+    """
+    Assembles .asm file (filename) into a .hack file of the same base name.
+    If asm_lines is given (e.g. the output of VMtranslator_main), it is
+    assembled instead of reading filename from disk. If rom_image is True,
+    the machine code is also written as a binary ROM image (.rom, see
+    assembler_write_rom_image). Returns the machine code as an array of
+    16-bit instruction words.
+    """
+    from array import array
     from parser import Parser
-    from code import code
-    
+    from code import c_instruction
+
     # load parser object with assembly file
-    asm = Parser(filename)
+    asm = Parser(filename, lines = asm_lines)
 
-    # generate list of assembly commands:
-    machine_code = []
+    # generate array of instruction words:
+    machine_code = array('H')
     next_variable_loc = 16
-    finished = False
-    while finished == False:
-        if asm.has_more_commands() == False:
-            finished = True
-        #print('is true')
-        #print(asm.current_command)
-        if asm.command_type() == 'A_COMMAND':
-            
+    sym_table = asm.sym_table
+    for instruction in asm:
+        if instruction.kind == 'A_COMMAND':
+
             # check if not a variable:
-            if asm.symbol().isdecimal():
-                machine_code.append ('0' + assembler_convert_to_15bit_bin(asm.symbol()))
-            elif asm.sym_table.contains(asm.symbol()):
+            if instruction.value is not None:
+                if instruction.value > 32767:
+                    raise ValueError(f'A instruction value out of range (0-32767): {instruction.text}')
+                machine_code.append(instruction.value)
+            elif sym_table.contains(instruction.symbol):
                 # variable or label is alread in the table. set @ instr with value.
-                loc_string = str(asm.sym_table.get_address(asm.symbol()))
-                machine_code.append ('0' + assembler_convert_to_15bit_bin(loc_string))
+                machine_code.append(sym_table.get_address(instruction.symbol))
 
             else:
                 # variable hasn't been used. add it to table and set @ instr.
-                asm.sym_table.add_entry(asm.symbol(),next_variable_loc)
-                machine_code.append ('0' + assembler_convert_to_15bit_bin(str(next_variable_loc)))
-                next_variable_loc += 1        
-            
-        elif asm.command_type() == 'C_COMMAND':
-            command = []
-            command.append('111')
-            command.append(code(asm.comp(),'comp'))
-            command.append(code(asm.dest(),'dest'))
-            command.append(code(asm.jump(),'jump'))
-            machine_code.append(''.join(command))
-            
-        elif asm.command_type() == 'L_COMMAND':
-            raise ValueError('L commands should have been dealt with by parser.')
-        
-        if asm.has_more_commands() == True:
-            asm.advance()
+                sym_table.add_entry(instruction.symbol,next_variable_loc)
+                machine_code.append(next_variable_loc)
+                next_variable_loc += 1
+
+        else:
+            # one table lookup for the whole dest=comp;jump:
+            machine_code.append(c_instruction(instruction.text))
 
     # write the machine code to file with basename + .hack (overwrites)
-    #print(machine_code)
     base_name = filename[:filename.find('.asm')]
     hack_name = base_name + '.hack'
     with open(hack_name,'w') as newfile:
-        for code in machine_code:
-            newfile.write(code)
-            newfile.write('\n')
+        newfile.write(''.join([f'{word:016b}\n' for word in machine_code]))
+    if rom_image:
+        assembler_write_rom_image(base_name + '.rom', machine_code)
+    return machine_code
 
-def assembler_convert_to_15bit_bin(number):
-    # returns 15 bit binary string of input number which is a string
-    binary_version = str(bin(int(number)))[2:]
-    lead = '0' * (15 - len(binary_version))
-    return lead + binary_version
-    
-if __name__ == '__main__':
+def assembler_write_rom_image(rom_name, machine_code):
+    """
+    Writes machine code (an array('H')) as a binary ROM image: the raw
+    16-bit instruction words, little-endian, with no header. It can be
+    read back with array.frombytes or mapped with mmap.
+    """
     import sys
-    filearg = sys.argv[1]
-    assembler_main(filearg)
+    if sys.byteorder == 'big':
+        machine_code = machine_code[:]
+        machine_code.byteswap()
+    with open(rom_name,'wb') as newfile:
+        machine_code.tofile(newfile)
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Assemble a .asm file to a .hack file.')
+    argparser.add_argument('filename', help = '.asm file')
+    argparser.add_argument('--rom-image', action = 'store_true',
+                           help = 'also write a binary ROM image (.rom, 16-bit little-endian words)')
+    args = argparser.parse_args()
+    assembler_main(args.filename, rom_image = args.rom_image)
@@ -1,58 +1,110 @@
 # Code function for HACK assembler.
 
+from functools import lru_cache
+
+JUMP = {'null':'000',
+            'JGT':'001',
+            'JEQ':'010',
+            'JGE':'011',
+            'JLT':'100',
+            'JNE':'101',
+            'JLE':'110',
+            'JMP':'111'
+            }
+DEST = {'null':'000',
+            'M':'001',
+            'D':'010',
+            'MD':'011',
+            'A':'100',
+            'AM':'101',
+            'AD':'110',
+            'AMD':'111'}
+COMP = {'0':'101010',
+            '1':'111111',
+            '-1':'111010',
+            'D':'001100',
+            'A':'110000',
+            '!D':'001101',
+            '!A':'110001',
+            '-D':'001111',
+            '-A':'110011',
+            'D+1':'011111',
+            '1+D':'011111',
+            'A+1':'110111',
+            '1+A':'110111',
+            'D-1':'001110',
+            'A-1':'110010',
+            'D+A':'000010',
+            'A+D':'000010',
+            'D-A':'010011',
+            'A-D':'000111',
+            'D&A':'000000',
+            'A&D':'000000',
+            'D|A':'010101',
+            'A|D':'010101'
+    }
+
 def code(mnemonic,mtype):
     # returns binary version of assembly mnemonic of type mtype
-    jump = {'null':'000',
-                'JGT':'001',
-                'JEQ':'010',
-                'JGE':'011',
-                'JLT':'100',
-                'JNE':'101',
-                'JLE':'110',
-                'JMP':'111'
-                }
-    dest = {'null':'000',
-                'M':'001',
-                'D':'010',
-                'MD':'011',
-                'A':'100',
-                'AM':'101',
-                'AD':'110',
-                'AMD':'111'}
-    comp = {'0':'101010',
-                '1':'111111',
-                '-1':'111010',
-                'D':'001100',
-                'A':'110000',
-                '!D':'001101',
-                '!A':'110001',
-                '-D':'001111',
-                '-A':'110011',
-                'D+1':'011111',
-                '1+D':'011111',
-                'A+1':'110111',
-                '1+A':'110111',
-                'D-1':'001110',
-                'A-1':'110010',
-                'D+A':'000010',
-                'A+D':'000010',
-                'D-A':'010011',
-                'A-D':'000111',
-                'D&A':'000000',
-                'A&D':'000000',
-                'D|A':'010101',
-                'A|D':'010101'
-        }
     if mtype == 'comp':
         if 'M' in mnemonic:
             a = '1'
             mnemonic = mnemonic.replace('M','A')
         else:
             a = '0'
-        return a + comp[mnemonic]
+        return a + COMP[mnemonic]
     elif mtype == 'jump':
-        return jump[mnemonic]
+        return JUMP[mnemonic]
     elif mtype == 'dest':
-        return dest[mnemonic]
+        return DEST[mnemonic]
     else:
         raise ValueError('no mtype provided in for assembly code.')
+
+def _c_instruction_table():
+    # returns {C instruction text: 16 bit instruction word} for every
+    # dest=comp;jump as it is usually written (without spaces, dest
+    # letters in AMD order, no null fields)
+    comps = {}
+    for mnemonic in COMP:
+        comps[mnemonic] = '0' + COMP[mnemonic]
+        if 'A' in mnemonic:
+            comps[mnemonic.replace('A','M')] = '1' + COMP[mnemonic]
+    table = {}
+    for dest_mnemonic, dest_bits in DEST.items():
+        for comp_mnemonic, comp_bits in comps.items():
+            for jump_mnemonic, jump_bits in JUMP.items():
+                text = comp_mnemonic
+                if dest_mnemonic != 'null':
+                    text = dest_mnemonic + '=' + text
+                if jump_mnemonic != 'null':
+                    text = text + ';' + jump_mnemonic
+                table[text] = int('111' + comp_bits + dest_bits + jump_bits, 2)
+    return table
+
+# Built once, when the assembler is loaded:
+C_INSTRUCTIONS = _c_instruction_table()
+
+def c_instruction(text):
+    # returns the instruction word (int) of a whole C instruction (no spaces)
+    word = C_INSTRUCTIONS.get(text)
+    if word is None:
+        word = _unusual_c_instruction(text)
+    return word
+
+@lru_cache(maxsize = 256)
+def _unusual_c_instruction(text):
+    # C instructions not in the table: explicit null fields, dest
+    # letters in another order (DM=...), etc.
+    dest_mnemonic, comp_mnemonic, jump_mnemonic = 'null', text, 'null'
+    if '=' in comp_mnemonic:
+        dest_mnemonic, comp_mnemonic = comp_mnemonic.split('=')
+    if ';' in comp_mnemonic:
+        comp_mnemonic, jump_mnemonic = comp_mnemonic.split(';')
+    if dest_mnemonic not in DEST:
+        if dest_mnemonic == '' or set(dest_mnemonic) - set('AMD') or len(set(dest_mnemonic)) != len(dest_mnemonic):
+            raise ValueError(f'Invalid dest in C instruction: {text}')
+        dest_mnemonic = ''.join(letter for letter in 'AMD' if letter in dest_mnemonic)
+    try:
+        return int('111' + code(comp_mnemonic,'comp') + code(dest_mnemonic,'dest') + code(jump_mnemonic,'jump'), 2)
+    except KeyError:
+        raise ValueError(f'Invalid C instruction: {text}') from None
@@ -1,98 +1,68 @@
 ### Contains the parser module for the assembler for the Hack Computer TECS ###
 
+class Instruction():
+    """One A or C instruction of an assembly file, split up once by Parser.
+    kind is 'A_COMMAND' or 'C_COMMAND'. A instructions have symbol (the
+    text after @) and value (its int value if it is a number, else None).
+    C instructions have dest, comp and jump ('null' if left out) and text,
+    the whole instruction without spaces."""
+    __slots__ = ('kind', 'symbol', 'value', 'dest', 'comp', 'jump', 'text')
+
+    def __init__(self, kind, symbol=None, value=None, dest='null', comp=None, jump='null', text=''):
+        self.kind = kind
+        self.symbol = symbol
+        self.value = value
+        self.dest = dest
+        self.comp = comp
+        self.jump = jump
+        self.text = text
+
+    def __repr__(self):
+        return f'Instruction({self.kind}, {self.text!r})'
+
 class Parser():
-    """Takes a .asm file name when initialized. returns object with attributes
-    relating to current command and can be stepped through the asm file."""
+    """Takes a .asm file name when initialized. Reads the file in one pass:
+    labels are added to the symbol table (sym_table) and every other line
+    becomes an Instruction. Iterating over the parser gives the
+    instructions in order.
+    If lines is given, it is used as the file contents instead of reading
+    input_file_name from disk."""
 
-    def __init__(self,input_file_name):
+    def __init__(self,input_file_name,lines=None):
         from symbol_table import AssemblerSymbolTable
-        self.lines = []
-        with open(input_file_name, 'r') as file:
-            for line in file:
-                if '//' in line:
-                    comment_index = line.find('//')
-                    stripped_line = line[:comment_index].strip()
-                else:
-                    stripped_line = line.strip()
-                if len(stripped_line) > 0:
-                    stripped_line = stripped_line.replace(' ','')
-                    self.lines.append(stripped_line)
+        if lines is None:
+            with open(input_file_name, 'r') as file:
+                lines = file.read().splitlines()
+        self.sym_table = AssemblerSymbolTable(assembler_map_init = True)
+        self.instructions = []
+        for line in lines:
+            if '//' in line:
+                line = line[:line.find('//')]
+            line = line.replace(' ','').strip()
+            if len(line) == 0:
+                continue
+            match line[0]:
+                case '(':
+                    # Add label to symbol table, it is the address of the next instruction:
+                    self.sym_table.add_entry(line[1:-1],len(self.instructions))
+                case '@':
+                    symbol = line[1:]
+                    value = int(symbol) if symbol.isdecimal() else None
+                    self.instructions.append(Instruction('A_COMMAND', symbol = symbol, value = value, text = line))
+                case _:
+                    dest, comp, jump = 'null', line, 'null'
+                    if '=' in comp:
+                        dest, comp = comp.split('=')
+                    if ';' in comp:
+                        comp, jump = comp.split(';')
+                    self.instructions.append(Instruction('C_COMMAND', dest = dest, comp = comp, jump = jump,
+                                                         text = line))
         # Check for empty file:
-        if len(self.lines) < 1:
+        if len(self.instructions) < 1:
             raise ValueError('assembly file is empty')
 
-        # Initialize a symbol table and do first pass of assembly to:
-        # 1. add labels to symbol table
-        # 2. remove labels from list of instructions
-        self.sym_table = AssemblerSymbolTable(assembler_map_init = True)
-        counter = 0
-        newlines = []
-        for line in self.lines:
-            if line[0] == '(':
-                # Add label to symbol table and remove line:
-                self.sym_table.add_entry(line[1:-1],counter)
-            else:
-                newlines.append(line)
-                counter += 1
-        self.lines = newlines
-
-        # Attributes:
-        self.current_index = 0
-        self.current_command = self.lines[self.current_index]
-        self.max_index = len(self.lines) - 1
-         
-    def has_more_commands(self):
-        if self.current_index < self.max_index:
-            return True
-        else:
-            return False
-
-    def advance(self):
-        """Advances to next command in list."""
-        self.current_index += 1
-        if self.current_index > self.max_index:
-            raise ValueError('Tried to force parser advance beyond last command in file.')
-        self.current_command = self.lines[self.current_index]
-        
-    def command_type(self):
-        """Checks command type of current command."""
-        # First symbol will be one of '(','@',other
-        first_char = self.current_command[0]
-        if first_char == '(':
-            return 'L_COMMAND'
-        elif first_char == '@':
-            return 'A_COMMAND'
-        else:
-            return 'C_COMMAND'
-
-    def symbol(self):
-        """Returns 'Xxx' for @Xxx or (Xxx) command."""
-        if self.current_command[0] == '(':
-            return self.current_command.rstrip()[1:-1]
-        elif self.current_command[0] == '@':
-            return self.current_command.rstrip()[1:]
-        else:
-            raise ValueError('inappropriate call of parser.symbol')
-
-    def dest(self):
-        if '=' in self.current_command:
-            return self.current_command.split('=')[0]
-        else:
-            return 'null'
-        
-    def comp(self):
-        if '=' in self.current_command:
-            return self.current_command.split('=')[1]
-        elif ';' in self.current_command:
-            return self.current_command.split(';')[0]
-        else:
-            raise ValueError('inappropriate call of parser.comp')
+    def __iter__(self):
+        return iter(self.instructions)
 
-    def jump(self):
-        if ';' in self.current_command:
-            return self.current_command.split(';')[1]
-        elif '=' in self.current_command:
-            return 'null'
-        
-        else:
-            raise ValueError('inappropriate call of parser.jump')
+    def __len__(self):
+        return len(self.instructions)
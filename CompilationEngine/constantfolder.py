@@ -0,0 +1,197 @@
+
+from jackast import (LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                     IntegerConstant, KeywordConstant, VarRef, ArrayAccess, SubroutineCall,
+                     UnaryOp, BinaryOp, ShiftLeft)
+
+# x * 2**k is compiled as k doublings (a few VM commands each) for k up
+# to MAX_DOUBLINGS. Past that the doublings take more ROM than the call
+# to Math.multiply they replace.
+MAX_DOUBLINGS = 4
+
+def to_int16(value) -> int:
+    """Wraps value to a 16-bit two's complement int, like the Hack ALU."""
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+class ConstantFolder:
+    """Evaluates the constant subexpressions of a class (a jackast.ClassDec)
+    at compile time and simplifies identities like x+0, x*1 and x*0.
+    Values are computed as the Hack computer computes them, in 16-bit
+    two's complement."""
+
+    def fold_class(self, class_dec):
+        """Folds every subroutine of the class in place and returns it."""
+        for subroutine in class_dec.subroutines:
+            self.fold_statements(subroutine.statements)
+        return class_dec
+
+    def fold_statements(self, statements):
+        """Folds the expressions of a list of statements in place."""
+        for statement in statements:
+            match statement:
+                case LetStatement():
+                    if statement.index is not None:
+                        statement.index = self.fold_expression(statement.index)
+                    statement.value = self.fold_expression(statement.value)
+                case IfStatement():
+                    statement.condition = self.fold_expression(statement.condition)
+                    self.fold_statements(statement.statements)
+                    if statement.else_statements is not None:
+                        self.fold_statements(statement.else_statements)
+                case WhileStatement():
+                    statement.condition = self.fold_expression(statement.condition)
+                    self.fold_statements(statement.statements)
+                case DoStatement():
+                    statement.call = self.fold_expression(statement.call)
+                case ReturnStatement():
+                    if statement.value is not None:
+                        statement.value = self.fold_expression(statement.value)
+
+    def fold_expression(self, expression):
+        """Returns the folded expression (children are folded first)."""
+        match expression:
+            case ArrayAccess():
+                expression.index = self.fold_expression(expression.index)
+            case SubroutineCall():
+                expression.args = [self.fold_expression(arg) for arg in expression.args]
+            case UnaryOp():
+                expression.operand = self.fold_expression(expression.operand)
+                return self.fold_unary_op(expression)
+            case BinaryOp():
+                expression.left = self.fold_expression(expression.left)
+                expression.right = self.fold_expression(expression.right)
+                return self.fold_binary_op(expression)
+        return expression
+
+    def fold_unary_op(self, expression):
+        operand = expression.operand
+        value = constant_value(operand)
+        if value is not None:
+            if expression.op == '-':
+                return IntegerConstant(to_int16(-value))
+            return IntegerConstant(~value)
+        # -(-x) and ~(~x) are x:
+        if isinstance(operand, UnaryOp) and operand.op == expression.op:
+            return operand.operand
+        return expression
+
+    def fold_binary_op(self, expression):
+        op, left, right = expression.op, expression.left, expression.right
+        a, b = constant_value(left), constant_value(right)
+        if a is not None and b is not None:
+            value = evaluate(op, a, b)
+            if value is None:
+                # e.g. division by zero is left to fail at run time
+                return expression
+            return IntegerConstant(value)
+        match op:
+            case '+':
+                if a == 0:
+                    return right
+                if b == 0:
+                    return left
+            case '-':
+                if b == 0:
+                    return left
+                if a == 0:
+                    return UnaryOp('-', right)
+            case '*':
+                # the constant is on the right from here on:
+                if a is not None:
+                    left, right, b = right, left, a
+                if b == 1:
+                    return left
+                if b == -1:
+                    return UnaryOp('-', left)
+                if b == 0 and is_pure(left):
+                    return IntegerConstant(0)
+                if b is not None and b > 1 and b & (b - 1) == 0 and b.bit_length() - 1 <= MAX_DOUBLINGS:
+                    return ShiftLeft(left, b.bit_length() - 1)
+            case '/':
+                # Math.divide doesn't divide -32768 like other values (see evaluate):
+                if b == 1 and is_never_min_int(left):
+                    return left
+            case '&':
+                if a == -1:
+                    return right
+                if b == -1:
+                    return left
+                if (a == 0 and is_pure(right)) or (b == 0 and is_pure(left)):
+                    return IntegerConstant(0)
+            case '|':
+                if a == 0:
+                    return right
+                if b == 0:
+                    return left
+                if (a == -1 and is_pure(right)) or (b == -1 and is_pure(left)):
+                    return IntegerConstant(-1)
+        return expression
+
+def constant_value(expression):
+    """Returns the value of a constant expression node, else None."""
+    match expression:
+        case IntegerConstant():
+            return expression.value
+        case KeywordConstant():
+            return {'true':-1, 'false':0, 'null':0}.get(expression.keyword)
+    return None
+
+def evaluate(op, a, b):
+    """Returns a op b as computed by the compiled code, or None if it
+    can't be computed at compile time."""
+    match op:
+        case '+':
+            return to_int16(a + b)
+        case '-':
+            return to_int16(a - b)
+        case '*':
+            return to_int16(a * b)
+        case '/':
+            # Math.divide divides the absolute values, which -32768 has not
+            if b == 0 or a == -32768 or b == -32768:
+                return None
+            quotient = abs(a) // abs(b)
+            if (a < 0) != (b < 0):
+                return -quotient
+            return quotient
+        case '&':
+            return a & b
+        case '|':
+            return a | b
+        # comparisons are compiled as the sign of x-y, which can overflow:
+        case '<':
+            return -1 if to_int16(a - b) < 0 else 0
+        case '>':
+            return -1 if to_int16(a - b) > 0 else 0
+        case '=':
+            return -1 if a == b else 0
+    return None
+
+def is_never_min_int(expression) -> bool:
+    """True if expression can't evaluate to -32768: a constant other than
+    -32768, true, false, null, a comparison (-1 or 0), or an & with a
+    constant that is not negative."""
+    match expression:
+        case IntegerConstant():
+            return expression.value != -32768
+        case KeywordConstant():
+            return expression.keyword != 'this'
+        case BinaryOp() if expression.op in ('<', '>', '='):
+            return True
+        case BinaryOp() if expression.op == '&':
+            return any(value is not None and value >= 0
+                       for value in (constant_value(expression.left), constant_value(expression.right)))
+    return False
+
+def is_pure(expression) -> bool:
+    """True if evaluating expression has no side effects, so it can be
+    dropped. Subroutine calls and strings (which are allocated) aren't."""
+    match expression:
+        case IntegerConstant() | KeywordConstant() | VarRef():
+            return True
+        case ArrayAccess():
+            return is_pure(expression.index)
+        case UnaryOp() | ShiftLeft():
+            return is_pure(expression.operand)
+        case BinaryOp():
+            return is_pure(expression.left) and is_pure(expression.right)
+    return False
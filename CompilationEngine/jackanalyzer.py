@@ -4,14 +4,26 @@
 # converts it to .xml files in the same directory.
 # Tested on python 3.10.0
 
-def jack_analyzer_main(filename):
+def jack_analyzer_main(filename, write_vm=True, jobs=1, cache=None, streaming=False, emit_xml=False,
+                       fold_constants=False, string_pool=False, compare_branch=False):
     """
     Compiles .jack file (filename) into .vm file.
     If filename is folder, compiles all .jack files within.
+    Returns a list of (vm file name, vm line list) for each compiled
+    class. If write_vm is False the .vm files are not written to disk.
+    If jobs > 1, the classes are compiled in a pool of that many
+    processes. The output is the same as compiling them one at a time.
+    If a BuildCache is given, unchanged classes are taken from it instead
+    of being recompiled. If streaming is True, each file is tokenized
+    while it is compiled instead of up front (see StreamingJackTokenizer).
+    If emit_xml is True, the parse tree of each class is also written to
+    an xml file (Xxx.jack -> Xxxm.xml). If fold_constants is True,
+    constant subexpressions are evaluated at compile time (see
+    ConstantFolder). If string_pool is True, each string literal is
+    built once and kept in a static (see VMCodeGenerator). If
+    compare_branch is True, the nots of ~x conditions of if and while
+    statements cancel (see VMCodeGenerator).
     """
-    from jacktokenizer import JackTokenizer
-    from compilationengine import CompilationEngine
-    from vmwriter import VMWriter
     import os
     # Handle directory or .vm file:
     if os.path.isdir(filename):
@@ -22,39 +34,124 @@ def jack_analyzer_main(filename):
             jackfilelist.extend(os.path.join(dirpath,insidefilename) for insidefilename in insidefilenames)
     else:
         jackfilelist = [filename]
-    
+    jackfilelist = [jfile for jfile in jackfilelist if jfile[-5:] == '.jack']
+
+    # Look up unchanged classes in the build cache (the parse tree
+    # isn't cached, so every class is compiled when it is wanted):
+    jack_sources = {}
+    cached_vm_lists = {}
+    if cache is not None and not emit_xml:
+        for jackfile in jackfilelist:
+            with open(jackfile, 'r') as file:
+                jack_sources[jackfile] = file.read()
+            cached_vm_list = cache.get('jack', jack_sources[jackfile])
+            if cached_vm_list is not None:
+                cached_vm_lists[jackfile] = cached_vm_list
+    compile_list = [jfile for jfile in jackfilelist if jfile not in cached_vm_lists]
+
+    # Compile .jack files into vm code. Each class is independent, so
+    # they can be compiled in parallel. Results are collected in file
+    # order, so "Coding ..." names the file if its compilation fails.
+    if jobs > 1 and len(compile_list) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers = jobs)
+        futures = [executor.submit(jack_analyzer_compile, jackfile, streaming, emit_xml,
+                                   fold_constants, string_pool, compare_branch) for jackfile in compile_list]
+        results = (future.result() for future in futures)
+    else:
+        executor = None
+        results = (jack_analyzer_compile(jackfile, streaming, emit_xml, fold_constants, string_pool, compare_branch)
+                   for jackfile in compile_list)
+
     # Compile .jack files into .vm files:
-    for jackfile in [jfile for jfile in jackfilelist if jfile[-5:] == '.jack']:
-        print(f"Coding {jackfile}.")
-        output_line_list = []
+    vm_sources = []
+    try:
+        for jackfile in jackfilelist:
+            if jackfile in cached_vm_lists:
+                print(f"Using cached {jackfile}.")
+                output_vm_list = cached_vm_lists[jackfile]
+            else:
+                print(f"Coding {jackfile}.")
+                output_vm_list, output_xml_list = next(results)
+                if cache is not None and not emit_xml:
+                    cache.put('jack', jack_sources[jackfile], output_vm_list)
+                if emit_xml:
+                    # Write output xml file:
+                    output_file_name = jackfile[:-5] + 'm.xml'
+                    with open(output_file_name,'w') as outfile:
+                        outfile.write('\n'.join(output_xml_list))
+
+            # Write output vm file:
+            output_vm_file_name = jackfile[:-5] + '.vm'
+            vm_sources.append((output_vm_file_name, output_vm_list))
+            if write_vm:
+                with open(output_vm_file_name,'w') as outfile:
+                    outfile.write('\n'.join(output_vm_list))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+    return vm_sources
+
+def jack_analyzer_compile(jackfile, streaming=False, emit_xml=False, fold_constants=False, string_pool=False,
+                          compare_branch=False):
+    """
+    Compiles one .jack file and returns its list of vm code lines and,
+    if emit_xml is True, its list of parse tree xml lines (else None).
+    Module level so it can be run in a worker process.
+    """
+    from jacktokenizer import JackTokenizer, StreamingJackTokenizer
+    from compilationengine import CompilationEngine
+    from vmcodegenerator import VMCodeGenerator
+    from vmwriter import VMWriter
+    from xmllistener import XMLListener
+    if streaming:
+        tokenizer = StreamingJackTokenizer(jackfile)
+    else:
         tokenizer = JackTokenizer(jackfile)
-        vmwriter = VMWriter()
-        compilation_engine = CompilationEngine(tokenizer, vmwriter, output_line_list)
+    if emit_xml:
+        listener = XMLListener()
+    else:
+        listener = None
+    compilation_engine = CompilationEngine(tokenizer, listener)
+
+    # Parse jack code into a syntax tree:
+    if tokenizer.current_token == 'class':
+        class_dec = compilation_engine.compile_class()
+    else:
+        raise SyntaxError(f'{jackfile} does not start with class: {tokenizer.current_token}')
 
-        # Generate output_line_list / compile jack code:
-        if tokenizer.current_token == 'class':
-            compilation_engine.compile_class()
-        else:
-            raise SyntaxError(f'File does not start with class: {tokenizer.current_token}')
+    if fold_constants:
+        from constantfolder import ConstantFolder
+        ConstantFolder().fold_class(class_dec)
 
-        # Write output vm file:
-        output_vm_file_name = jackfile[:-5] + '.vm'
-        output_vm_list = vmwriter.get_output_list()
-        with open(output_vm_file_name,'w') as outfile:
-            outfile.write('\n'.join(output_vm_list))
+    # Generate vm code from the syntax tree:
+    vmwriter = VMWriter()
+    VMCodeGenerator(vmwriter, string_pool, compare_branch).generate_class(class_dec)
 
-        # Print vm code:
-        # vmwriter.print_vm_code()
+    # Print vm code:
+    # vmwriter.print_vm_code()
 
-        # Write output xml file:
-        # output_file_name = jackfile[:-5] + 'm.xml'
-        # with open(output_file_name,'w') as outfile:
-        #    outfile.write('\n'.join(output_line_list))
+    if listener is not None:
+        return vmwriter.get_output_list(), listener.get_output_list()
+    return vmwriter.get_output_list(), None
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) < 2:
-        raise ValueError('No input file given.')
-    else:
-        filearg = sys.argv[1]
-    jack_analyzer_main(filearg)
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Compile .jack files to .vm files.')
+    argparser.add_argument('filename', help = '.jack file or folder of .jack files')
+    argparser.add_argument('--jobs', type = int, default = 1,
+                           help = 'number of processes used to compile classes in parallel')
+    argparser.add_argument('--stream', action = 'store_true',
+                           help = 'tokenize each file while compiling it, to bound memory use')
+    argparser.add_argument('--emit-xml', action = 'store_true',
+                           help = 'also write the parse tree of each class to an xml file')
+    argparser.add_argument('--fold-constants', action = 'store_true',
+                           help = 'evaluate constant expressions at compile time')
+    argparser.add_argument('--string-pool', action = 'store_true',
+                           help = 'build each string literal once and keep it in a static')
+    argparser.add_argument('--compare-branch', action = 'store_true',
+                           help = 'write if (~x) and while (~x) tests without the two nots')
+    args = argparser.parse_args()
+    jack_analyzer_main(args.filename, jobs = args.jobs, streaming = args.stream, emit_xml = args.emit_xml,
+                       fold_constants = args.fold_constants, string_pool = args.string_pool,
+                       compare_branch = args.compare_branch)
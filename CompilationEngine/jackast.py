@@ -0,0 +1,127 @@
+### Typed abstract syntax tree for Jack classes. ###
+# CompilationEngine parses a class into these nodes and VMCodeGenerator
+# walks them to write VM code. Identifiers are resolved with the symbol
+# table while parsing, so the nodes carry segment kinds and indices.
+
+class ClassDec:
+    """class name { classVarDec* subroutineDec* }"""
+    __slots__ = ('name', 'static_count', 'field_count', 'subroutines')
+    def __init__(self, name, static_count, field_count, subroutines):
+        self.name = name
+        self.static_count = static_count
+        self.field_count = field_count
+        self.subroutines = subroutines # [SubroutineDec,...]
+
+class SubroutineDec:
+    """('constructor'|'function'|'method') type name (parameterList) body"""
+    __slots__ = ('kind', 'return_type', 'name', 'local_count', 'statements')
+    def __init__(self, kind, return_type, name, local_count, statements):
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        self.local_count = local_count
+        self.statements = statements # [statement,...]
+
+########################################## Statements ##########################################
+
+class LetStatement:
+    """let target([index])? = value;"""
+    __slots__ = ('target', 'index', 'value')
+    def __init__(self, target, index, value):
+        self.target = target # VarRef
+        self.index = index # expression or None
+        self.value = value
+
+class IfStatement:
+    """if (condition) {statements} (else {else_statements})?"""
+    __slots__ = ('condition', 'statements', 'else_statements')
+    def __init__(self, condition, statements, else_statements):
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements # None if there is no else
+
+class WhileStatement:
+    """while (condition) {statements}"""
+    __slots__ = ('condition', 'statements')
+    def __init__(self, condition, statements):
+        self.condition = condition
+        self.statements = statements
+
+class DoStatement:
+    """do call;"""
+    __slots__ = ('call',)
+    def __init__(self, call):
+        self.call = call # SubroutineCall
+
+class ReturnStatement:
+    """return value?;"""
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value # expression or None
+
+########################################## Expressions ##########################################
+
+class IntegerConstant:
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value # int
+
+class StringConstant:
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value # str
+
+class KeywordConstant:
+    __slots__ = ('keyword',)
+    def __init__(self, keyword):
+        self.keyword = keyword # 'true', 'false', 'null' or 'this'
+
+class VarRef:
+    """Variable resolved in the symbol table."""
+    __slots__ = ('name', 'kind', 'index', 'type')
+    def __init__(self, name, kind, index, type):
+        self.name = name
+        self.kind = kind # 'static', 'field', 'arg' or 'var'
+        self.index = index
+        self.type = type
+
+class ArrayAccess:
+    """var[index]"""
+    __slots__ = ('var', 'index')
+    def __init__(self, var, index):
+        self.var = var # VarRef
+        self.index = index
+
+class SubroutineCall:
+    """Call of class_name.name(args). receiver is the object passed to a
+    method (a VarRef, or KeywordConstant('this')), None for functions and
+    constructors."""
+    __slots__ = ('class_name', 'name', 'args', 'receiver')
+    def __init__(self, class_name, name, args, receiver):
+        self.class_name = class_name
+        self.name = name
+        self.args = args # [expression,...]
+        self.receiver = receiver
+
+class UnaryOp:
+    """op operand, op is '-' or '~'"""
+    __slots__ = ('op', 'operand')
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+class BinaryOp:
+    """left op right, op is one of + - * / & | < > ="""
+    __slots__ = ('op', 'left', 'right')
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class ShiftLeft:
+    """operand * 2**count, computed with count doublings instead of a
+    Math.multiply call (made by ConstantFolder)."""
+    __slots__ = ('operand', 'count')
+    def __init__(self, operand, count):
+        self.operand = operand
+        self.count = count
@@ -1,30 +1,76 @@
 
+import re
+from array import array
+
+KEYWORDS = frozenset({'class', 'constructor', 'function', 'method', 'field', 'static',
+                      'var', 'int', 'char', 'boolean', 'void', 'true', 'false',
+                      'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return'})
+
+# <, > and & are stored escaped, as they are written to xml:
+SYMBOLS = {'{':'{', '}':'}', '(':'(', ')':')', '[':'[', ']':']', '.':'.',
+           ',':',', ';':';', '+':'+', '-':'-', '*':'*', '/':'/', '&':'&amp;',
+           '|':'|', '<':'&lt;', '>':'&gt;', '=':'=', '~':'~'}
+
+# Master pattern for the tokenizer. Each match skips whitespace and
+# comments (//, /* */ and /** */, which may span lines), then captures
+# exactly one token's text. The last alternatives always match, so the
+# greedy skip is never backtracked into: an unclosed comment or string,
+# or an invalid character, is captured and reported as an error.
+# The scan ends with empty matches at the end of the source.
+TOKEN_PATTERN = re.compile(r"""
+    (?:\s+|//[^\n]*|/\*.*?\*/)*
+    (   \w+
+      | "[^"\n]*"
+      | /\*
+      | [{}()\[\].,;+\-*/&|<>=~"]
+      | \Z
+      | .
+    )""", re.VERBOSE | re.DOTALL)
+
+# Token types are stored as an index into TOKEN_TYPES:
+TOKEN_TYPES = ('keyword', 'symbol', 'identifier', 'integerConstant', 'stringConstant')
+
+# Token text -> (token_type, token) for symbols and keywords:
+KNOWN_TOKENS = {symbol: ('symbol', token) for (symbol, token) in SYMBOLS.items()}
+KNOWN_TOKENS.update((keyword, ('keyword', keyword)) for keyword in KEYWORDS)
+
 class JackTokenizer:
-    def __init__(self, input_file_name): #TODO
-        # TODO: handle multiline comments, remove whitespace, iterate over parts.
+    # The token stream is stored compactly: for the nth token,
+    # token_types[n] is its type as an index into TOKEN_TYPES and
+    # token_values[n] is the index of its value in value_table, which
+    # holds each distinct token value once.
+    __slots__ = ('token_types', 'token_values', 'value_table',
+                 'current_token', 'current_token_idx')
+
+    def __init__(self, input_file_name):
         output_file_name = input_file_name[:-5]+'_Tmars.xml'
-        self.lines = []
-        self.tokens_list = [] # [(token_type,token),...] e.g. [('symbol','{'),...]
-        # Get lines from file, remove comments, whitespace:
-        self.lines = self.__get_stripped_lines__(input_file_name)
+        with open(input_file_name, 'r') as file:
+            source = file.read()
+        # Split the source into tokens (comments and whitespace removed):
+        self.__tokenize__(source)
         # Check for empty file:
-        if len(self.lines) < 1:
+        if len(self.token_types) < 1:
             raise ValueError('JACK file is empty')
-        # Split lines into tokens here
-        self.__tokenize__()
         # first token
-        self.current_token = self.tokens_list[0][1]
+        self.current_token = self.value_table[self.token_values[0]]
         self.current_token_idx = 0
 
+    @property
+    def tokens_list(self) -> list:
+        """Returns the tokens as [(token_type,token),...] e.g. [('symbol','{'),...]"""
+        value_table = self.value_table
+        return [(TOKEN_TYPES[type_code], value_table[value_id])
+                for (type_code, value_id) in zip(self.token_types, self.token_values)]
+
     def has_more_tokens(self) -> bool:
-        return len(self.tokens_list) > self.current_token_idx + 1
+        return len(self.token_types) > self.current_token_idx + 1
 
     def advance(self):
         self.current_token_idx += 1
-        self.current_token = self.tokens_list[self.current_token_idx][1]
+        self.current_token = self.value_table[self.token_values[self.current_token_idx]]
 
     def token_type(self) -> str:
-        return self.tokens_list[self.current_token_idx][0]
+        return TOKEN_TYPES[self.token_types[self.current_token_idx]]
 
     def keyword(self) -> str:
         return self.current_token
@@ -48,123 +94,53 @@ class JackTokenizer:
 
     def look_ahead_token(self) -> str:
         if self.has_more_tokens():
-            next_token = self.tokens_list[self.current_token_idx + 1][1]
+            next_token = self.value_table[self.token_values[self.current_token_idx + 1]]
             return next_token
         return ''
 
-    def __tokenize__(self):
-        for line in self.lines:
-            char_list = []
-            for char in line:
-                char_list.append(char)
-            idx = 0
-            current_word = []
-            while idx < len(char_list):
-                char = char_list[idx]
-                match char:
-                    # if end of a word, add that to the tokens list first
-                    case '"':
-                        if current_word:
-                            self.tokens_list.append(self.__tokenize_word__(current_word))
-                            current_word = []
-                        if not '"' in char_list[idx+1:]:
-                            print('char_list: ', char_list)
-                            print(f'idx: {idx}')
-                            raise SyntaxError('No support for multi-line strings.')
-                        closing_idx = char_list.index('"',idx+1)
-                        # Don't include quotes in token:
-                        StringConstant = ''.join(char_list[idx+1:closing_idx])
-                        self.tokens_list.append(('stringConstant', StringConstant))
-                        idx = closing_idx
-                    case ('{'|'}'|'('|')'|'['|']'|'.'|
-                            ','|';'|'+'|'-'|'*'|'/'|'&'|
-                           '|'|'<'|'>'|'='|'~'):
-                        if current_word: # a symbol ends the word
-                            self.tokens_list.append(self.__tokenize_word__(current_word))
-                            current_word = []
-                        match char:
-                            case '<':
-                                symbol = '&lt;'
-                            case '>':
-                                symbol = '&gt;'
-                            case '&':
-                                symbol = '&amp;'
-                            case _:
-                                symbol = char
-                        self.tokens_list.append(('symbol', symbol))
-                    case ' ':
-                        if current_word: # ' ' ends the word
-                            self.tokens_list.append(self.__tokenize_word__(current_word))
-                            current_word = []
-                    case _:
-                        current_word.append(char)
-                idx += 1
-            if current_word:
-                            self.tokens_list.append(self.__tokenize_word__(current_word))
-                            current_word = []
-
-    def __tokenize_word__(self, word):
-        # print(f'tokenizing:{word}')
-        word = ''.join(word)
-        # returns (token_type,token_value) of word,  for INT_CONST, KEYWORD, IDENTIFIER
-        keywords = {'class', 'constructor', 'function', 'method', 'field', 'static',
-                    'var', 'int', 'char', 'boolean', 'void', 'true', 'false',
-                    'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return'}
-        is_keyword = word in keywords
-        is_integer = word.isnumeric()
-        if is_keyword:
-            token = ('keyword', word)
-        elif is_integer:
-            token = ('integerConstant', int(word))
-        else:
-            token = ('identifier', word)
-        # if no match, there's been a problem:
-        if not token:
-            print(f'Invalid word in __tokenize_word__: {word}')
-            return
-        return token
+    def __tokenize__(self, source):
+        """Scans the whole source in one pass and fills the token arrays."""
+        token_texts = TOKEN_PATTERN.findall(source)
+        while token_texts and token_texts[-1] == '':
+            token_texts.pop()
+        # Each distinct token text is classified once and gets a value id:
+        value_ids = {}
+        self.value_table = []
+        type_codes = []
+        for text in token_texts:
+            if text not in value_ids:
+                token_type, token = KNOWN_TOKENS.get(text) or self.__tokenize_word__(text, source)
+                value_ids[text] = len(self.value_table)
+                self.value_table.append(token)
+                type_codes.append(TOKEN_TYPES.index(token_type))
+        token_values = [value_ids[text] for text in token_texts]
+        self.token_values = array('I', token_values)
+        self.token_types = array('B', [type_codes[value_id] for value_id in token_values])
 
-    def __get_stripped_lines__(self, input_file_name):
-        lines = []
-        with open(input_file_name, 'r') as file:
-            in_multiline_comment = False
-            for line in file:
-                # comment types: //, /** */, or /* */
-                if in_multiline_comment:
-                    #print(f'in multiline comment line:{line}')
-                    close_in_this_line = '*/' in line
-                    #print(f'close in this line: {close_in_this_line}')
-                    if close_in_this_line:
-                        in_multiline_comment = False
-                        begin_after_comment_idx = line.index('*/') + 2
-                        if begin_after_comment_idx < len(line):
-                            stripped_line = line[begin_after_comment_idx:].strip()
-                elif '/**' in line or '/*' in line:
-                    if '/**' in line:
-                        begin_open_comment_idx = line.index('/**')
-                        end_open_comment_idx = begin_open_comment_idx + 2
-                    else:
-                        begin_open_comment_idx = line.index('/*')
-                        end_open_comment_idx = begin_open_comment_idx + 1
-                    stripped_line = line[:begin_open_comment_idx].strip()
-                    begin_comment_idx = end_open_comment_idx + 1
-                    in_multiline_comment = True
-                    close_in_this_line = '*/' in line[begin_comment_idx:]
-                    if close_in_this_line:
-                        in_multiline_comment = False
-                        begin_after_comment_idx = line.index('*/',begin_comment_idx) + 2
-                        if begin_after_comment_idx < len(line):
-                            stripped_line = stripped_line + line[begin_after_comment_idx:]
-                            stripped_line = stripped_line.strip()
-                elif '//' in line:
-                    comment_index = line.find('//')
-                    stripped_line = line[:comment_index].strip()
-                else:
-                    stripped_line = line.strip()
-
-                if len(stripped_line) > 0:
-                    lines.append(stripped_line)
-        return lines
+    def __tokenize_word__(self, word, source, line_number=None):
+        # returns (token_type,token_value) of word, for INT_CONST, STRING_CONST, IDENTIFIER
+        # (symbols and keywords are in KNOWN_TOKENS)
+        if word[0] == '"' and len(word) > 1:
+            # Don't include quotes in token:
+            return ('stringConstant', word[1:-1])
+        elif word[0].isalnum() or word[0] == '_':
+            if word.isnumeric():
+                return ('integerConstant', int(word))
+            return ('identifier', word)
+        # if no match, there's been a problem:
+        if line_number is None:
+            line_number = 1
+            for match in TOKEN_PATTERN.finditer(source):
+                if match.group(1) == word:
+                    line_number = source.count('\n', 0, match.start(1)) + 1
+                    break
+        match word:
+            case '"':
+                raise SyntaxError(f'No support for multi-line strings (line {line_number}).')
+            case '/*':
+                raise SyntaxError(f'Comment is never closed (line {line_number}).')
+            case _:
+                raise SyntaxError(f'Invalid character {word!r} (line {line_number}).')
 
     def __generate_output_xml_file__(self, output_file_name):
         with open(output_file_name,'w') as outfile:
@@ -173,3 +149,65 @@ class JackTokenizer:
                 outlines.append(f'<{token_type}> {token_val} </{token_type}>')
             outlines.append('</tokens>')
             outfile.write('\n'.join(outlines))
+
+
+class StreamingJackTokenizer(JackTokenizer):
+    """JackTokenizer that reads and tokenizes the file while the tokens
+    are consumed, instead of tokenizing the whole file up front. Only the
+    current and next token are kept, so memory use doesn't grow with the
+    size of the file."""
+    __slots__ = ('token_stream', 'current_type', 'next_type', 'next_token')
+
+    def __init__(self, input_file_name):
+        self.token_stream = self.__stream_tokens__(input_file_name)
+        # Fill the lookahead buffer:
+        self.next_type, self.next_token = next(self.token_stream, (None, None))
+        # Check for empty file:
+        if self.next_type is None:
+            raise ValueError('JACK file is empty')
+        # first token
+        self.current_token_idx = -1
+        self.advance()
+
+    @property
+    def tokens_list(self) -> list:
+        raise TypeError('StreamingJackTokenizer does not keep a token list.')
+
+    def has_more_tokens(self) -> bool:
+        return self.next_type is not None
+
+    def advance(self):
+        self.current_token_idx += 1
+        self.current_type, self.current_token = self.next_type, self.next_token
+        self.next_type, self.next_token = next(self.token_stream, (None, None))
+
+    def token_type(self) -> str:
+        return self.current_type
+
+    def look_ahead_token(self) -> str:
+        if self.has_more_tokens():
+            return self.next_token
+        return ''
+
+    def __stream_tokens__(self, input_file_name):
+        """Generator of (token_type, token) read from the file one line at
+        a time. The lines inside a /* comment that isn't closed on its
+        first line are skipped until the line that closes it."""
+        with open(input_file_name, 'r') as file:
+            comment_line_number = None
+            for line_number, line in enumerate(file, 1):
+                if comment_line_number is not None:
+                    if '*/' not in line:
+                        continue
+                    # Rest of the line after the comment is tokenized:
+                    line = '/*' + line
+                    comment_line_number = None
+                for match in TOKEN_PATTERN.finditer(line):
+                    word = match.group(1)
+                    if word == '/*':
+                        comment_line_number = line_number
+                        break
+                    elif word:
+                        yield KNOWN_TOKENS.get(word) or self.__tokenize_word__(word, line, line_number)
+            if comment_line_number is not None:
+                self.__tokenize_word__('/*', line, comment_line_number)
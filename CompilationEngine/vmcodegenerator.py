@@ -0,0 +1,240 @@
+
+from jackast import (LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                     IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayAccess,
+                     SubroutineCall, UnaryOp, BinaryOp, ShiftLeft)
+
+class VMCodeGenerator:
+    """Writes the VM code of a class parsed by CompilationEngine (a
+    jackast.ClassDec) with a VMWriter.
+    If string_pool is True, each different string literal of the class
+    is built once, the first time it is used, and kept in an extra static
+    variable after the class's own statics. Later uses push the static.
+    All uses of a literal then share one String object, so programs
+    must not change or dispose it.
+    If compare_branch is True, the nots of an if or while condition ~x
+    cancel, so a comparison in x is followed by the if-goto directly and
+    the translator can jump on it (see VMCodeWriter.write_compare_branch)."""
+    def __init__(self, vmwriter, string_pool=False, compare_branch=False):
+        """Initializes a generator writing to vmwriter."""
+        self.vmwriter = vmwriter
+        self.label_count = 0
+        self.string_pool = string_pool
+        self.compare_branch = compare_branch
+
+    def generate_class(self, class_dec):
+        """Writes the VM code of every subroutine of the class."""
+        self.class_dec = class_dec
+        self.pool_statics = {} # {string literal: static index}
+        for subroutine in class_dec.subroutines:
+            self.generate_subroutine(subroutine)
+
+    def generate_subroutine(self, subroutine):
+        """Writes the VM code of a method, function, or constructor."""
+        # vm code for function def
+        self.vmwriter.function(f'{self.class_dec.name}.{subroutine.name}', subroutine.local_count)
+        match subroutine.kind:
+            case 'method':
+                # put base of this object in pointer 0: this
+                self.vmwriter.push('arg', 0)
+                self.vmwriter.pop('pointer', 0)
+            case 'constructor':
+                # allocate memory block for new object
+                self.vmwriter.push('constant', self.class_dec.field_count)
+                self.vmwriter.call('Memory.alloc', 1)
+                # set base of this segment (pointer 0) to point at base of object
+                self.vmwriter.pop('pointer', 0)
+        self.generate_statements(subroutine.statements)
+
+    def generate_statements(self, statements):
+        """Writes the VM code of a list of statements."""
+        for statement in statements:
+            match statement:
+                case LetStatement():
+                    self.generate_let(statement)
+                case IfStatement():
+                    self.generate_if(statement)
+                case WhileStatement():
+                    self.generate_while(statement)
+                case DoStatement():
+                    self.generate_expression(statement.call)
+                    # do always ignores return value (assumes void method or function)
+                    # pop and ignore the returned value (constant 0)
+                    self.vmwriter.pop('temp', 0)
+                case ReturnStatement():
+                    if statement.value is None:
+                        # void functions must push 0 onto stack before returning
+                        # calls to void functions will throw away the value after return
+                        self.vmwriter.push('constant', 0)
+                    else:
+                        self.generate_expression(statement.value)
+                    self.vmwriter.ret()
+
+    def generate_let(self, statement):
+        """Writes the VM code of a let statement."""
+        target = statement.target
+        if statement.index is None:
+            self.generate_expression(statement.value)
+            # set variable to top value from stack
+            self.vmwriter.pop(target.kind, target.index)
+        else:
+            # Support for setting values in array:
+            # Add index to array pointer, put address in temp
+            # pointer 1 may get overwritten by the value expression
+            self.generate_expression(statement.index)
+            self.vmwriter.push(target.kind, target.index) # array base
+            self.vmwriter.arithmetic('add')
+            self.vmwriter.pop('temp', 1)
+            self.generate_expression(statement.value)
+            # pop value to array entry (address previously stored in temp 1)
+            self.vmwriter.push('temp', 1)
+            self.vmwriter.pop('pointer', 1)
+            self.vmwriter.pop('that', 0)
+
+    def generate_while(self, statement):
+        """Writes the VM code of a while statement."""
+        label_number = self.label_count
+        self.label_count += 1
+        # WHILE_COND
+        self.vmwriter.label(f'WHILE_BEG{label_number}')
+        # IF not WHILE_COND true goto WHILE_END
+        self.generate_jump_if_false(statement.condition, f'WHILE_END{label_number}')
+        self.generate_statements(statement.statements)
+        # goto beginning of while condition
+        self.vmwriter.goto(f'WHILE_BEG{label_number}')
+        self.vmwriter.label(f'WHILE_END{label_number}')
+
+    def generate_if(self, statement):
+        """Writes the VM code of an if statement, including optional else."""
+        label_number = self.label_count
+        self.label_count += 1
+        # if if condition not true, goto else
+        self.generate_jump_if_false(statement.condition, f'IF_ELSE{label_number}')
+        self.generate_statements(statement.statements)
+        # VM goto end of else
+        self.vmwriter.goto(f'IF_ELSE_END{label_number}')
+        # end of if statements, beginning of else or rest of code
+        self.vmwriter.label(f'IF_ELSE{label_number}')
+        if statement.else_statements is not None:
+            self.generate_statements(statement.else_statements)
+        self.vmwriter.label(f'IF_ELSE_END{label_number}')
+
+    def generate_string(self, value):
+        """Writes VM code that pushes a new String holding value."""
+        # use String.new(length) and String.appendChar(nextChar) to
+        # generate new string object and then push to stack
+        # nargs is 1 (String.new is constructor)
+        self.vmwriter.push('constant', len(value))
+        self.vmwriter.call('String.new', 1)
+        for char in value:
+            self.vmwriter.push('constant', ord(char))
+            # nargs is 2 because appendChar is a method
+            # string reference is already on stack
+            self.vmwriter.call('String.appendChar', 2)
+
+    def generate_jump_if_false(self, condition, label):
+        """Writes VM code that goes to label if condition is false (0)."""
+        if self.compare_branch and isinstance(condition, UnaryOp) and condition.op == '~':
+            # not(~x) is x, so the two nots cancel:
+            self.generate_expression(condition.operand)
+        else:
+            self.generate_expression(condition)
+            self.vmwriter.arithmetic('not')
+        self.vmwriter.if_goto(label)
+
+    def generate_expression(self, expression):
+        """Writes VM code that pushes the value of expression."""
+        builtin_ops = {'+':'add', '&':'and', '|':'or', '<':'lt', '>':'gt', '=':'eq'}
+        match expression:
+            case IntegerConstant():
+                # folded constants can be negative, but push constant
+                # only takes 0..32767:
+                value = expression.value
+                if value == -32768:
+                    self.vmwriter.push('constant', 32767)
+                    self.vmwriter.arithmetic('not')
+                elif value < 0:
+                    self.vmwriter.push('constant', -value)
+                    self.vmwriter.arithmetic('neg')
+                else:
+                    self.vmwriter.push('constant', value)
+            case KeywordConstant():
+                match expression.keyword:
+                    case 'true':
+                        self.vmwriter.push('constant', 1)
+                        self.vmwriter.arithmetic('neg')
+                    case ('false' | 'null'):
+                        self.vmwriter.push('constant', 0)
+                    case 'this':
+                        self.vmwriter.push('pointer', 0)
+            case StringConstant():
+                if self.string_pool:
+                    # build the string only if its static is still 0 (null):
+                    if expression.value not in self.pool_statics:
+                        self.pool_statics[expression.value] = self.class_dec.static_count + len(self.pool_statics)
+                    static_index = self.pool_statics[expression.value]
+                    label_number = self.label_count
+                    self.label_count += 1
+                    self.vmwriter.push('static', static_index)
+                    self.vmwriter.if_goto(f'STRING_POOL{label_number}')
+                    self.generate_string(expression.value)
+                    self.vmwriter.pop('static', static_index)
+                    self.vmwriter.label(f'STRING_POOL{label_number}')
+                    self.vmwriter.push('static', static_index)
+                else:
+                    self.generate_string(expression.value)
+            case VarRef():
+                self.vmwriter.push(expression.kind, expression.index)
+            case ArrayAccess():
+                # Add index to array pointer, put address in pointer 1
+                # push array entry to top of stack
+                self.generate_expression(expression.index)
+                self.vmwriter.push(expression.var.kind, expression.var.index)
+                self.vmwriter.arithmetic('add')
+                self.vmwriter.pop('pointer', 1)
+                self.vmwriter.push('that', 0)
+            case SubroutineCall():
+                nargs = len(expression.args)
+                if expression.receiver is not None:
+                    # push object to be passed as arg 0 to method
+                    self.generate_expression(expression.receiver)
+                    nargs += 1
+                for arg in expression.args:
+                    self.generate_expression(arg)
+                self.vmwriter.call(f'{expression.class_name}.{expression.name}', nargs)
+            case ShiftLeft():
+                # double the value count times, through temp 2
+                # (temp 0 and temp 1 are used by do and let statements).
+                # temp 2 only has to hold its value from the pop to the two
+                # pushes right after it, with no call or other expression
+                # in between, so nested shifts, called functions (OS ones
+                # included) and the translator, which doesn't use temp,
+                # can't change it while it is live:
+                self.generate_expression(expression.operand)
+                for _ in range(expression.count):
+                    self.vmwriter.pop('temp', 2)
+                    self.vmwriter.push('temp', 2)
+                    self.vmwriter.push('temp', 2)
+                    self.vmwriter.arithmetic('add')
+            case UnaryOp():
+                self.generate_expression(expression.operand)
+                if expression.op == '-':
+                    self.vmwriter.arithmetic('neg')
+                else: # ~
+                    self.vmwriter.arithmetic('not')
+            case BinaryOp():
+                self.generate_expression(expression.left)
+                self.generate_expression(expression.right)
+                op = expression.op
+                if op == '-':
+                    # 'neg' makes second term negative, but if part of
+                    # expression the two terms still must be added together.
+                    self.vmwriter.arithmetic('neg')
+                    self.vmwriter.arithmetic('add')
+                elif op in builtin_ops:
+                    self.vmwriter.arithmetic(builtin_ops[op])
+                elif op == '*':
+                    self.vmwriter.call('Math.multiply', 2)
+                elif op == '/':
+                    self.vmwriter.call('Math.divide', 2)
+            case _:
+                raise TypeError(f'Unknown expression node (generate_expression): {expression!r}')
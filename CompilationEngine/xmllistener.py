@@ -0,0 +1,28 @@
+
+class XMLListener:
+    """Collects the parse tree traced by a CompilationEngine as xml lines,
+    including the symbol table notes (<STentry> and <IDuse>)."""
+    def __init__(self) -> None:
+        """Initialize a new listener with an empty output list."""
+        self.output_list = []
+
+    def open_tag(self, tag):
+        """Writes the opening tag of a parse tree node."""
+        self.output_list.append(f'<{tag}>')
+
+    def close_tag(self, tag):
+        """Writes the closing tag of a parse tree node."""
+        self.output_list.append(f'</{tag}>')
+
+    def token(self, token_type, token):
+        """Writes a terminal token, e.g. <symbol> { </symbol>."""
+        self.output_list.append(f'<{token_type}> {token} </{token_type}>')
+
+    def note(self, tag, *words):
+        """Writes a symbol table note, e.g. <IDuse> use class Main </IDuse>."""
+        text = ' '.join(str(word) for word in words)
+        self.output_list.append(f'<{tag}> {text} </{tag}>')
+
+    def get_output_list(self):
+        """Returns the output list for writing to file."""
+        return self.output_list
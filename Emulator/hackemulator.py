@@ -0,0 +1,274 @@
+#!/usr/bin/env python3.10
+
+# Runs a .hack machine code file on an emulated Hack computer (TECS),
+# headless, and prints the number of instructions run, the speed and
+# a range of RAM. Used to benchmark and check compiled programs.
+# Tested on python 3.10.0
+
+from array import array
+
+# Sizes of the Hack memories in 16-bit words:
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+
+# Longest run of instructions compiled into one block:
+MAX_BLOCK_LENGTH = 256
+
+# Python expression for each comp field (zx nx zy ny f no) of a C
+# instruction. x is D, y is A or M. Values are unsigned 16-bit.
+COMP_EXPRESSIONS = {0b101010: '0',
+                    0b111111: '1',
+                    0b111010: '65535',
+                    0b001100: 'd',
+                    0b110000: 'y',
+                    0b001101: 'd ^ 65535',
+                    0b110001: 'y ^ 65535',
+                    0b001111: '-d & 65535',
+                    0b110011: '-y & 65535',
+                    0b011111: '(d + 1) & 65535',
+                    0b110111: '(y + 1) & 65535',
+                    0b001110: '(d - 1) & 65535',
+                    0b110010: '(y - 1) & 65535',
+                    0b000010: '(d + y) & 65535',
+                    0b010011: '(d - y) & 65535',
+                    0b000111: '(y - d) & 65535',
+                    0b000000: 'd & y',
+                    0b010101: 'd | y'}
+
+# Python condition for each jump field, on the unsigned ALU output r:
+JUMP_CONDITIONS = {0b001: '0 < r < 32768', # JGT
+                   0b010: 'r == 0', # JEQ
+                   0b011: 'r < 32768', # JGE
+                   0b100: 'r >= 32768', # JLT
+                   0b101: 'r != 0', # JNE
+                   0b110: 'r == 0 or r >= 32768', # JLE
+                   0b111: 'True'} # JMP
+
+def alu(x, y, comp):
+    """Computes any comp field (zx nx zy ny f no) of the Hack ALU,
+    including the ones that have no assembly mnemonic."""
+    if comp & 0b100000:
+        x = 0
+    if comp & 0b010000:
+        x ^= 65535
+    if comp & 0b001000:
+        y = 0
+    if comp & 0b000100:
+        y ^= 65535
+    if comp & 0b000010:
+        out = (x + y) & 65535
+    else:
+        out = x & y
+    if comp & 0b000001:
+        out ^= 65535
+    return out
+
+class HackEmulator:
+    """Emulates the Hack CPU running a program in ROM.
+    Instructions are decoded once, when they are first run: each run of
+    instructions up to the next jump becomes a block, compiled into one
+    Python function that runs the whole block. Blocks are kept in a
+    dispatch table indexed by their start address. RAM and ROM are
+    arrays of unsigned 16-bit words."""
+
+    def __init__(self, rom):
+        """Initializes a computer with rom (a sequence of instruction
+        words, e.g. from load_program) and clear RAM."""
+        if len(rom) > ROM_SIZE:
+            raise ValueError(f'Program has {len(rom)} instructions, ROM only holds {ROM_SIZE}.')
+        self.rom = array('H', rom)
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        # Dispatch table: block function and length for each start address
+        self.block_functions = [None] * len(self.rom)
+        self.block_lengths = [0] * len(self.rom)
+        self.reset()
+
+    def reset(self):
+        """Sets the registers and the instruction count to 0 (RAM is kept)."""
+        self.pc = 0
+        self.a = 0
+        self.d = 0
+        self.steps = 0
+        self.halted = False
+
+    def run(self, max_steps, instruction_counts=None):
+        """Runs until max_steps instructions have been run in total, or
+        until the program halts (jumps to itself with @X, 0;JMP, or runs
+        past the end of ROM). Returns the number of instructions run.
+        If instruction_counts is given (a list with an entry for each ROM
+        address), the number of times each instruction is run is added
+        to it."""
+        block_functions, block_lengths = self.block_functions, self.block_lengths
+        rom_length = len(self.rom)
+        pc, a, d, steps = self.pc, self.a, self.d, self.steps
+        # blocks only exit at their end, so counting the blocks run is enough:
+        block_counts = None if instruction_counts is None else [0] * rom_length
+        while steps < max_steps:
+            if pc >= rom_length:
+                self.halted = True
+                break
+            block_function = block_functions[pc]
+            if block_function is None:
+                block_function = self.compile_block(pc)
+            length = block_lengths[pc]
+            if length == 0:
+                self.halted = True
+                break
+            if steps + length > max_steps:
+                # not enough steps left for the whole block:
+                block_function = self.compile_block(pc, max_steps - steps)
+                length = max_steps - steps
+                if block_counts is not None:
+                    for address in range(pc, pc + length):
+                        instruction_counts[address] += 1
+            elif block_counts is not None:
+                block_counts[pc] += 1
+            pc, a, d = block_function(a, d)
+            steps += length
+        if block_counts is not None:
+            for start, count in enumerate(block_counts):
+                if count:
+                    for address in range(start, start + block_lengths[start]):
+                        instruction_counts[address] += count
+        started = self.steps
+        self.pc, self.a, self.d, self.steps = pc, a, d, steps
+        return steps - started
+
+    def compile_block(self, start, max_length=MAX_BLOCK_LENGTH):
+        """Compiles the block of instructions starting at address start
+        into a function (a, d) -> (next pc, a, d). The block ends after
+        the first jump (conditional or not), or after max_length
+        instructions. Full length blocks (max_length MAX_BLOCK_LENGTH)
+        are added to the dispatch table."""
+        rom = self.rom
+        body = []
+        known_a = None # value of A, if set by an A instruction in the block
+        pc = start
+        next_pc = None
+        while next_pc is None and pc < len(rom) and pc - start < max_length:
+            instruction = rom[pc]
+            pc += 1
+            if instruction & 0x8000 == 0:
+                # A instruction
+                known_a = instruction
+                body.append(f'a = {instruction}')
+                continue
+            # C instruction: 111a cccc ccdd djjj
+            comp = (instruction >> 6) & 0b111111
+            uses_m = instruction & 0x1000
+            dest = (instruction >> 3) & 0b111
+            jump = instruction & 0b111
+            # the jump goes to A as it was before this instruction:
+            if known_a is not None:
+                address = str(known_a & 32767)
+                target = str(known_a)
+            else:
+                address = 'a & 32767'
+                target = 'old_a' if dest & 0b100 else 'a'
+            if uses_m:
+                y = f'ram[{address}]'
+            elif known_a is not None:
+                y = str(known_a)
+            else:
+                y = 'a'
+            if comp in COMP_EXPRESSIONS:
+                expression = COMP_EXPRESSIONS[comp].replace('y', y)
+            else:
+                expression = f'alu(d, {y}, {comp})'
+            if dest == 0 and jump == 0:
+                # no effect
+                continue
+            if target == 'old_a' and jump != 0:
+                body.append('old_a = a')
+            body.append(f'r = {expression}')
+            if dest & 0b001:
+                body.append(f'ram[{address}] = r')
+            if dest & 0b100:
+                body.append('a = r')
+                known_a = None
+            if dest & 0b010:
+                body.append('d = r')
+            if jump == 0b111:
+                if target == str(start) and pc - start == 2:
+                    # @start, 0;JMP is the halt loop
+                    self.block_functions[start] = lambda a, d: (start, a, d)
+                    return self.block_functions[start]
+                next_pc = target
+            elif jump != 0:
+                body.append(f'if {JUMP_CONDITIONS[jump]}:')
+                body.append(f'    return ({target}, a, d)')
+                next_pc = str(pc)
+        if next_pc is None:
+            next_pc = str(pc)
+        source = ['def block(a, d, ram=ram, alu=alu):']
+        source.extend('    ' + line for line in body)
+        source.append(f'    return ({next_pc}, a, d)')
+        namespace = {'ram': self.ram, 'alu': alu}
+        exec('\n'.join(source), namespace)
+        block_function = namespace['block']
+        if max_length == MAX_BLOCK_LENGTH:
+            self.block_functions[start] = block_function
+            self.block_lengths[start] = pc - start
+        return block_function
+
+    def peek(self, address) -> int:
+        """Returns RAM[address] as a signed 16-bit int."""
+        value = self.ram[address]
+        if value >= 32768:
+            return value - 65536
+        return value
+
+def load_hack_file(file_name) -> array:
+    """Returns the instructions of a .hack file (one 16-bit binary
+    number per line) as an array of words."""
+    with open(file_name, 'r') as file:
+        return array('H', [int(line, 2) for line in file.read().split()])
+
+def load_rom_image(file_name) -> array:
+    """Returns the instructions of a binary ROM image (16-bit
+    little-endian words, as written by assembler_main) as an array."""
+    import sys
+    rom = array('H')
+    with open(file_name, 'rb') as file:
+        rom.frombytes(file.read())
+    if sys.byteorder == 'big':
+        rom.byteswap()
+    return rom
+
+def load_program(file_name) -> array:
+    """Returns the instructions of a .rom image or a .hack file."""
+    if file_name.endswith('.rom'):
+        return load_rom_image(file_name)
+    return load_hack_file(file_name)
+
+def hack_emulator_main(file_name, max_steps, dump_range=None):
+    """Runs a .hack file or .rom image for up to max_steps instructions and
+    prints the instructions run, the speed and the RAM words in dump_range
+    ((first, last) addresses, inclusive)."""
+    import time
+    emulator = HackEmulator(load_program(file_name))
+    start_time = time.perf_counter()
+    steps = emulator.run(max_steps)
+    run_time = time.perf_counter() - start_time
+    state = 'halted' if emulator.halted else 'stopped'
+    print(f'{state} after {steps} instructions in {run_time:.2f}s '
+          f'({steps / max(run_time, 1e-9) / 1e6:.1f}M instructions/s)')
+    if dump_range is not None:
+        first, last = dump_range
+        print(f'RAM[{first}..{last}]: {[emulator.peek(address) for address in range(first, last + 1)]}')
+    return emulator
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Run a .hack file on an emulated Hack computer.')
+    argparser.add_argument('filename', help = '.hack file or .rom image')
+    argparser.add_argument('--steps', type = int, default = 10_000_000,
+                           help = 'maximum number of instructions to run')
+    argparser.add_argument('--dump', metavar = 'FIRST:LAST',
+                           help = 'print RAM[FIRST..LAST] after running')
+    args = argparser.parse_args()
+    dump_range = None
+    if args.dump is not None:
+        first, last = args.dump.split(':')
+        dump_range = (int(first), int(last))
+    hack_emulator_main(args.filename, args.steps, dump_range)
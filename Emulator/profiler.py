@@ -0,0 +1,144 @@
+#!/usr/bin/env python3.10
+
+# Profiles a compiled program: runs its .hack file on the emulator and
+# attributes the instructions run to VM functions and VM commands, using
+# the labels and "// Source line:" comments of its .asm file.
+# Usage: ./profiler.py Prog.asm [--steps N]  (runs Prog.hack)
+# Tested on python 3.10.0
+
+class Profiler:
+    """Maps ROM addresses to the VM function and VM command they were
+    translated from, and reports where a run of the program spent its
+    instructions. Code before the first function is counted as
+    'bootstrap', the shared call routines as '$$CALL' and '$$RETURN'."""
+
+    def __init__(self, asm_lines):
+        """Reads the function and VM command of each ROM address from the
+        assembly lines (as written by VMtranslator_main)."""
+        self.address_functions = []
+        self.address_commands = []
+        self.call_sites = [] # (address, caller, callee) of each call command
+        function = 'bootstrap'
+        command = ''
+        for line in asm_lines:
+            line = line.strip()
+            if line.startswith('//'):
+                if line[2:].strip().startswith('Source line:'):
+                    command = line[line.index(':') + 1:].strip()
+                    words = command.split()
+                    if words[0] == 'function':
+                        function = words[1]
+                    elif words[0] == 'call':
+                        self.call_sites.append((len(self.address_functions), function, words[1]))
+                continue
+            instruction = line.split('//')[0].replace(' ', '')
+            if instruction in ('($$CALL)', '($$RETURN)'):
+                function = instruction[1:-1]
+                command = ''
+            elif instruction and instruction[0] != '(':
+                self.address_functions.append(function)
+                self.address_commands.append(command)
+        # the bootstrap call to Sys.init has no Source line comment:
+        self.call_sites.insert(0, (0, 'bootstrap', 'Sys.init'))
+        self.instruction_counts = [0] * len(self.address_functions)
+
+    def run(self, emulator, max_steps):
+        """Runs the emulator (loaded with the program's .hack file) for up
+        to max_steps instructions, counting the instructions run."""
+        if len(emulator.rom) != len(self.instruction_counts):
+            raise ValueError('The .asm and .hack files are not the same program.')
+        return emulator.run(max_steps, instruction_counts = self.instruction_counts)
+
+    def function_counts(self) -> dict:
+        """Returns {function: instructions run in it}."""
+        counts = {}
+        for function, count in zip(self.address_functions, self.instruction_counts):
+            counts[function] = counts.get(function, 0) + count
+        return counts
+
+    def call_counts(self) -> dict:
+        """Returns {(caller, callee): number of calls}. A call command is
+        run as often as its first instruction."""
+        calls = {}
+        for address, caller, callee in self.call_sites:
+            if address < len(self.instruction_counts) and self.instruction_counts[address]:
+                calls[(caller, callee)] = calls.get((caller, callee), 0) + self.instruction_counts[address]
+        return calls
+
+    def flat_profile(self, command_rows=20) -> list:
+        """Returns the lines of a flat profile: the instructions run in each
+        function and the number of times it was called, then the
+        command_rows VM commands that ran the most instructions."""
+        total = max(sum(self.instruction_counts), 1)
+        calls_to = {}
+        for (caller, callee), count in self.call_counts().items():
+            calls_to[callee] = calls_to.get(callee, 0) + count
+        lines = [f'Flat profile ({sum(self.instruction_counts)} instructions):',
+                 '      %  instructions      calls  function']
+        for function, count in sorted(self.function_counts().items(), key = lambda item: -item[1]):
+            if count:
+                lines.append(f'{100 * count / total:7.2f}  {count:12}  {calls_to.get(function, 0):9}  {function}')
+        # VM commands, e.g. "Math.multiply: add":
+        command_counts = {}
+        for function, command, count in zip(self.address_functions, self.address_commands,
+                                            self.instruction_counts):
+            if count:
+                key = (function, command)
+                command_counts[key] = command_counts.get(key, 0) + count
+        lines.append('')
+        lines.append('VM commands:')
+        lines.append('      %  instructions  command')
+        hottest = sorted(command_counts.items(), key = lambda item: -item[1])[:command_rows]
+        for (function, command), count in hottest:
+            lines.append(f'{100 * count / total:7.2f}  {count:12}  {function}: {command}')
+        return lines
+
+    def call_graph(self) -> list:
+        """Returns the lines of the call graph: for each function that ran,
+        the functions that called it and the functions it called, with
+        the number of calls."""
+        calls = self.call_counts()
+        counts = self.function_counts()
+        lines = ['Call graph:']
+        for function, count in sorted(counts.items(), key = lambda item: -item[1]):
+            if not count:
+                continue
+            lines.append(f'{function} ({count} instructions)')
+            callers = sorted(((n, caller) for (caller, callee), n in calls.items() if callee == function), reverse = True)
+            for n, caller in callers:
+                lines.append(f'    called by {caller}: {n}')
+            callees = sorted(((n, callee) for (caller, callee), n in calls.items() if caller == function), reverse = True)
+            for n, callee in callees:
+                lines.append(f'    calls {callee}: {n}')
+        return lines
+
+def profiler_main(asm_name, max_steps, asm_lines=None, hack_name=None, rom=None):
+    """Runs the program Xxx.hack for up to max_steps instructions and
+    prints its flat profile and call graph, using Xxx.asm (asm_name) to
+    map instructions to VM functions and commands. If asm_lines is given,
+    it is used instead of reading asm_name, and if rom (the machine code
+    returned by assembler_main) is given, instead of reading Xxx.hack."""
+    from hackemulator import HackEmulator, load_program
+    if asm_lines is None:
+        with open(asm_name, 'r') as file:
+            asm_lines = file.read().splitlines()
+    if rom is None:
+        if hack_name is None:
+            hack_name = asm_name[:asm_name.find('.asm')] + '.hack'
+        rom = load_program(hack_name)
+    profiler = Profiler(asm_lines)
+    emulator = HackEmulator(rom)
+    profiler.run(emulator, max_steps)
+    print('\n'.join(profiler.flat_profile()))
+    print()
+    print('\n'.join(profiler.call_graph()))
+    return profiler
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Profile a compiled program (Xxx.asm and Xxx.hack).')
+    argparser.add_argument('filename', help = '.asm file of the program, written by VMtranslator.py')
+    argparser.add_argument('--steps', type = int, default = 10_000_000,
+                           help = 'maximum number of instructions to run')
+    args = argparser.parse_args()
+    profiler_main(args.filename, args.steps)
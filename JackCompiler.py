@@ -1,20 +1,55 @@
 #!/usr/bin/env python3.10
 
 # Takes a folder of .jack files as command line argument and
-# compiles it to .vm files in the same directory. VM files are then
-# compiled into one .asm assembly file in same directory as folder.
-# Assembly file is then compiled into one .hack machinde code file.
+# compiles it to VM code, which is translated into one assembly
+# program, which is assembled into one .hack machine code file
+# in same directory as folder. The stages are passed to each other
+# in memory. The intermediate .vm and .asm files are only written
+# if --write-intermediate is given.
 # .vm files for OS operations should be copied into folder containing
 # .jack files before compilation so that they will be included in
 # assembly.
 # Tested on python 3.10.0
 
-def jack_compiler_main(filename):
+def jack_compiler_main(filename, write_intermediate=False, jobs=1, use_cache=False, streaming=False,
+                       emit_xml=False, fold_constants=False, peephole=None, shared_calls=False,
+                       profile_steps=None, rom_image=False, remove_dead_functions=False, os_bundle_name=None,
+                       superinstructions=None, top_of_stack_in_d=False, inline=None,
+                       string_pool=False, compare_branch=False):
     """
     Compiles .jack file (filename) or files into .HACK machine code.
     If filename is folder, compiles all .jack files within. OS .vm files
     should be placed in the same directory so they are included in the 
-    .asm file.
+    .asm file. If write_intermediate is True, the .vm files and the .asm
+    file are also written to disk. jobs is the number of processes used
+    to compile the .jack files. If use_cache is True, the vm code of each
+    class and the assembly of each .vm file are kept in a .tecs-cache
+    folder next to the sources, and only changed files are rebuilt.
+    If streaming is True, .jack files are tokenized while they are compiled
+    instead of up front, so memory use doesn't grow with the file size.
+    If emit_xml is True, the parse tree of each class is written to xml.
+    If fold_constants is True, constant expressions in the .jack files are
+    evaluated at compile time. If peephole is a list of pattern names (see
+    PeepholeOptimizer), the assembly is optimized before it is assembled.
+    If shared_calls is True, all calls and returns jump to one shared
+    routine each, which makes the program smaller but slower.
+    If profile_steps is given, the program is run on the emulator for up
+    to that many instructions and its profile is printed. If rom_image is
+    True, a binary ROM image (.rom) is written next to the .hack file.
+    If remove_dead_functions is True, functions the program never calls
+    (e.g. unused OS functions) are left out of the assembly. If
+    os_bundle_name is given, the OS classes are linked from that bundle
+    (see OSBundle) instead of being translated, and don't have to be
+    copied into the folder. If superinstructions is a list of pattern
+    names (see SuperinstructionFuser), common runs of VM commands are
+    translated as one. If top_of_stack_in_d is True, the top of the stack
+    is kept in the D register where possible, which runs fewer instructions.
+    If inline is a budget of VM commands, calls to small functions are
+    replaced by their body, across all classes and the OS .vm files.
+    If string_pool is True, each string literal is built once, the first
+    time it is used, and kept in a static of its class. If compare_branch
+    is True, a comparison in an if or while condition jumps directly,
+    without building true or false first.
     """
     import sys
     from CompilationEngine.jackanalyzer import jack_analyzer_main
@@ -24,20 +59,106 @@ def jack_compiler_main(filename):
     sys.path.insert(0,'./CompilationEngine')
     sys.path.insert(0,'./VMtranslator')
     sys.path.insert(0,'./Assembler')
-    # Compile from .jack to .vm files:
-    jack_analyzer_main(filename)
-    # Compile from .vm files to one .asm assembly file:
-    VMtranslator_main(filename)
-    # Compile the single .asm file to .HACK machine code file:
+    sys.path.insert(0,'./Emulator')
+    if use_cache:
+        import os
+        from buildcache import BuildCache
+        if os.path.isdir(filename):
+            cache_dir = os.path.join(filename, '.tecs-cache')
+        else:
+            cache_dir = os.path.join(os.path.dirname(filename), '.tecs-cache')
+        # options that change the generated code are part of the cache key:
+        options = [option for (option, enabled) in [('fold-constants', fold_constants),
+                                                    ('shared-calls', shared_calls),
+                                                    ('top-of-stack-in-d', top_of_stack_in_d),
+                                                    ('string-pool', string_pool),
+                                                    ('compare-branch', compare_branch)] if enabled]
+        if superinstructions is not None:
+            options.append('superinstructions=' + ','.join(superinstructions))
+        if inline is not None:
+            options.append(f'inline={inline}')
+        cache = BuildCache(cache_dir, options = ' '.join(options))
+    else:
+        cache = None
+    if os_bundle_name is not None:
+        from osbundle import OSBundle
+        os_bundle = OSBundle(os_bundle_name, shared_calls = shared_calls)
+    else:
+        os_bundle = None
+    # Compile from .jack to vm code:
+    vm_sources = jack_analyzer_main(filename, write_vm = write_intermediate, jobs = jobs, cache = cache,
+                                    streaming = streaming, emit_xml = emit_xml, fold_constants = fold_constants,
+                                    string_pool = string_pool, compare_branch = compare_branch)
+    # Compile vm code (and OS .vm files) to one assembly program:
+    asm_lines = VMtranslator_main(filename, vm_sources = vm_sources, write_asm = write_intermediate, cache = cache,
+                                  peephole = peephole, shared_calls = shared_calls,
+                                  remove_dead_functions = remove_dead_functions, os_bundle = os_bundle,
+                                  superinstructions = superinstructions, top_of_stack_in_d = top_of_stack_in_d,
+                                  inline = inline, compare_branch = compare_branch)
+    if cache is not None:
+        cache.prune()
+    # Compile the assembly program to .HACK machine code file:
     if filename[-1] == '/':
         filename = filename[:-1]
     asm_name = filename + '.asm'
-    assembler_main(asm_name)
+    machine_code = assembler_main(asm_name, asm_lines = asm_lines, rom_image = rom_image)
+    if profile_steps is not None:
+        from profiler import profiler_main
+        profiler_main(asm_name, profile_steps, asm_lines = asm_lines, rom = machine_code)
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) < 2:
-        raise ValueError('No input file given.')
-    else:
-        filearg = sys.argv[1]
-    jack_compiler_main(filearg)
+    import argparse
+    from VMtranslator.peephole import PATTERNS
+    from VMtranslator.superinstructions import PATTERNS as SUPERINSTRUCTIONS
+    from VMtranslator.inliner import BUDGET
+    argparser = argparse.ArgumentParser(description = 'Compile .jack files to .hack machine code.')
+    argparser.add_argument('filename', help = 'folder of .jack files (and OS .vm files) to compile')
+    argparser.add_argument('--write-intermediate', action = 'store_true',
+                           help = 'also write the intermediate .vm and .asm files')
+    argparser.add_argument('--jobs', type = int, default = 1,
+                           help = 'number of processes used to compile classes in parallel')
+    argparser.add_argument('--cache', action = 'store_true',
+                           help = 'only rebuild files changed since the last build (uses Folder/.tecs-cache)')
+    argparser.add_argument('--stream', action = 'store_true',
+                           help = 'tokenize each .jack file while compiling it, to bound memory use')
+    argparser.add_argument('--emit-xml', action = 'store_true',
+                           help = 'also write the parse tree of each class to an xml file (Xxxm.xml)')
+    argparser.add_argument('--fold-constants', action = 'store_true',
+                           help = 'evaluate constant expressions and simplify x+0, x*1, x*0, x*2^k at compile time')
+    argparser.add_argument('--string-pool', action = 'store_true',
+                           help = 'build each string literal once, on first use, and keep it in a static')
+    argparser.add_argument('--peephole', nargs = '?', const = ','.join(PATTERNS),
+                           help = 'optimize the assembly with a comma separated list of patterns '
+                                  f'(default all: {",".join(PATTERNS)})')
+    argparser.add_argument('--shared-calls', action = 'store_true',
+                           help = 'use one shared routine for all calls and one for all returns, to save ROM')
+    argparser.add_argument('--superinstructions', nargs = '?', const = ','.join(SUPERINSTRUCTIONS),
+                           help = 'translate common runs of VM commands as one, with a comma separated list '
+                                  f'of patterns (default all: {",".join(SUPERINSTRUCTIONS)})')
+    argparser.add_argument('--top-of-stack-in-d', action = 'store_true',
+                           help = 'keep the top of the stack in the D register, to run fewer instructions')
+    argparser.add_argument('--inline', nargs = '?', type = int, const = BUDGET, metavar = 'BUDGET',
+                           help = 'replace calls to small functions with their body, adding at most BUDGET '
+                                  f'VM commands (default {BUDGET})')
+    argparser.add_argument('--compare-branch', action = 'store_true',
+                           help = 'jump on comparisons in if and while conditions directly, without building true/false')
+    argparser.add_argument('--profile', type = int, metavar = 'STEPS',
+                           help = 'run the program for up to STEPS instructions and print its profile')
+    argparser.add_argument('--remove-dead-functions', action = 'store_true',
+                           help = 'leave out functions that are never called from Sys.init, e.g. unused OS functions')
+    argparser.add_argument('--os-bundle', metavar = 'BUNDLE',
+                           help = 'link the OS from a bundle built with VMtranslator.py --build-os-bundle')
+    argparser.add_argument('--rom-image', action = 'store_true',
+                           help = 'also write a binary ROM image (.rom, 16-bit little-endian words)')
+    args = argparser.parse_args()
+    if args.peephole is not None:
+        args.peephole = args.peephole.split(',')
+    if args.superinstructions is not None:
+        args.superinstructions = args.superinstructions.split(',')
+    jack_compiler_main(args.filename, write_intermediate = args.write_intermediate, jobs = args.jobs,
+                       use_cache = args.cache, streaming = args.stream, emit_xml = args.emit_xml,
+                       fold_constants = args.fold_constants, peephole = args.peephole,
+                       shared_calls = args.shared_calls, profile_steps = args.profile, rom_image = args.rom_image,
+                       remove_dead_functions = args.remove_dead_functions, os_bundle_name = args.os_bundle,
+                       superinstructions = args.superinstructions, top_of_stack_in_d = args.top_of_stack_in_d,
+                       inline = args.inline, string_pool = args.string_pool, compare_branch = args.compare_branch)
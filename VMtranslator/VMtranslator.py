@@ -5,8 +5,39 @@
 # written in assembly to run on the HACK Computer(TECS).
 # Tested on python 3.10.0
 
-def VMtranslator_main(filename):
-    from vmcodewriter import VMCodeWriter
+def VMtranslator_main(filename, vm_sources=None, write_asm=True, cache=None, peephole=None,
+                      shared_calls=False, remove_dead_functions=False, os_bundle=None, superinstructions=None,
+                      top_of_stack_in_d=False, inline=None, compare_branch=False):
+    """
+    Translates .vm file (filename) or folder of .vm files into one .asm file.
+    vm_sources is an optional list of (vm file name, vm line list) that are
+    translated from memory instead of being read from disk, e.g. the output
+    of jack_analyzer_main. They replace .vm files of the same name in the
+    folder. Returns the list of assembly lines. If write_asm is False the
+    .asm file is not written to disk. If a BuildCache is given, the assembly
+    of unchanged .vm files is reused from it instead of being retranslated.
+    If peephole is a list of pattern names (see PeepholeOptimizer), the
+    assembly is optimized with them and the savings are printed.
+    If shared_calls is True, calls and returns use one shared routine each
+    (see VMCodeWriter) and the ROM saved is printed.
+    If remove_dead_functions is True, only the functions reachable from
+    Sys.init are translated (see DeadFunctionEliminator) and the dropped
+    functions are printed. If an OSBundle is given, .vm files that match
+    one of its classes, and the classes the program calls but doesn't
+    have, are linked from the bundle instead of being translated.
+    If superinstructions is a list of pattern names (see
+    SuperinstructionFuser), common runs of VM commands are translated as
+    one and the patterns used are printed.
+    If top_of_stack_in_d is True, the top of the stack is kept in D (see
+    VMCodeWriter) and the instructions of the translated files are
+    compared with the standard translation.
+    If inline is a budget of VM commands, calls to small functions are
+    replaced by their body (see Inliner) and the inlined functions are
+    printed.
+    If compare_branch is True, a comparison followed by an if-goto jumps
+    on the comparison directly (see VMCodeWriter.write_compare_branch).
+    """
+    from vmcodewriter import VMCodeWriter, count_instructions
     from vmparser import VMParser
     import os
     # handle directory or .vm file
@@ -27,49 +58,300 @@ def VMtranslator_main(filename):
     else:
         vmfilelist = [filename]
         base_name = filename[:filename.find('.vm')]
+    vmfilelist = [vfile for vfile in vmfilelist if vfile[-3:] == '.vm']
+    # in-memory sources replace files of the same name, others are added:
+    if vm_sources is None:
+        vm_sources = []
+    memory_sources = {os.path.normpath(name): lines for (name, lines) in vm_sources}
+    on_disk = {os.path.normpath(vfile) for vfile in vmfilelist}
+    vmfilelist.extend(name for (name, lines) in vm_sources if os.path.normpath(name) not in on_disk)
     # set output file name and initialize writer:
     asm_name = base_name + '.asm'
-    writer = VMCodeWriter(asm_name)
+    writer = VMCodeWriter(asm_name, shared_calls = shared_calls, top_of_stack_in_d = top_of_stack_in_d,
+                          compare_branch = compare_branch)
     # initialization:
     writer.write_init()   
-    for vmfile in [vfile for vfile in vmfilelist if vfile[-3:] == '.vm']: # will change for multiple files
-        print(f"Coding {vmfile}.")
-        parser = VMParser(vmfile) # change to loop over files
+    if superinstructions is not None:
+        from superinstructions import SuperinstructionFuser
+        fuser = SuperinstructionFuser(superinstructions)
+    else:
+        fuser = None
+    if top_of_stack_in_d:
+        # the translated files are also translated the standard way, to compare:
+        standard_writer = VMCodeWriter('', shared_calls = shared_calls, compare_branch = compare_branch)
+        standard_fuser = None if fuser is None else SuperinstructionFuser(superinstructions)
+        translated_size = 0
+    if inline is not None:
+        from inliner import Inliner
+        inliner = Inliner(budget = inline)
+    else:
+        inliner = None
+    steps, eliminator = VMtranslator_plan(vmfilelist, memory_sources, remove_dead_functions, os_bundle, inliner)
+    for step in steps:
+        if step[0] == 'link':
+            # pre-translated OS class:
+            link_name, fragments = step[1:]
+            print(f"Linking {link_name} from {os_bundle.bundle_name}.")
+            for fragment in fragments:
+                writer.write_fragment(fragment)
+            continue
+        vmfile, lines, commands = step[1:]
         stripped_file_name = os.path.basename(vmfile)[:-3] # get rid of folders,slashes,extensions
+        if cache is not None:
+            # static variables are named after the file, so it is part of the key:
+            if lines is None:
+                with open(vmfile, 'r') as file:
+                    lines = file.read().splitlines()
+            cache_source = stripped_file_name + '\n' + '\n'.join(lines)
+            fragment = cache.get('vm', cache_source)
+            if fragment is not None:
+                print(f"Using cached {vmfile}.")
+                writer.write_fragment(fragment)
+                continue
+        print(f"Coding {vmfile}.")
+        if commands is not None:
+            parser = commands
+        else:
+            parser = VMParser(vmfile, lines = lines)
         writer.set_file_name(stripped_file_name) # doesn't really do anything yet.may add label later.
-        finished = False
-        while finished == False:
-            if parser.has_more_commands() == False:
-                finished = True
-            # Deal with translating current command line:
-            # add comment for current line:
-            writer.write_comment(f"Source line:{parser.current_command}")
-            ctype = parser.command_type()
-            match ctype:
-                case 'C_ARITHMETIC':
-                    writer.write_arithmetic(command = parser.current_command) # 'add', 'eq', etc.
-                case 'C_PUSH':
-                    writer.write_push_pop(command = 'push', segment = parser.arg1(), index = parser.arg2())
-                case 'C_POP':
-                    writer.write_push_pop(command = 'pop', segment = parser.arg1(), index = parser.arg2())
-                # other cases to add here soon
-                case 'C_LABEL':
-                    writer.write_label(label = parser.arg1())
-                case 'C_GOTO':
-                    writer.write_goto(label = parser.arg1())
-                case 'C_IF':
-                    writer.write_if(label = parser.arg1())
-                case 'C_FUNCTION':
-                    writer.write_function(function_name = parser.arg1(), num_locals = parser.arg2())
-                case 'C_RETURN':
-                    writer.write_return()
-                case 'C_CALL':
-                    writer.write_call(function_name = parser.arg1(), num_args = parser.arg2())
-            if parser.has_more_commands() == True:
-                parser.advance()
-    writer.close()
+        fragment_start = writer.fragment_start()
+        VMtranslator_translate(writer, parser, fuser)
+        if top_of_stack_in_d:
+            translated_size += count_instructions(writer.lines[fragment_start[0]:])
+            standard_writer.set_file_name(stripped_file_name)
+            VMtranslator_translate(standard_writer, parser, standard_fuser)
+        if cache is not None:
+            cache.put('vm', cache_source, writer.fragment_since(fragment_start))
+    if inliner is not None:
+        print('\n'.join(inliner.report()))
+    if eliminator is not None:
+        # translate the dropped functions on their own to measure them:
+        dropped_writer = VMCodeWriter('', shared_calls = shared_calls, top_of_stack_in_d = top_of_stack_in_d,
+                                      compare_branch = compare_branch)
+        for vmfile, commands in eliminator.dropped_commands.items():
+            dropped_writer.set_file_name(os.path.basename(vmfile)[:-3])
+            VMtranslator_translate(dropped_writer, commands)
+        rom_saved = count_instructions(dropped_writer.lines)
+        for function_name in eliminator.dropped_library_functions:
+            rom_saved += count_instructions(os_bundle.functions[function_name]['fragment']['lines'])
+        print('\n'.join(eliminator.report(rom_saved)))
+    if fuser is not None:
+        print('\n'.join(fuser.report()))
+    if shared_calls:
+        print('\n'.join(writer.shared_calls_report()))
+    if top_of_stack_in_d:
+        print(f'Top of stack in D: {translated_size} instructions in the translated files, '
+              f'{count_instructions(standard_writer.lines)} with the standard translation.')
+    if peephole is not None:
+        from peephole import PeepholeOptimizer
+        optimizer = PeepholeOptimizer(peephole)
+        writer.lines = optimizer.optimize(writer.lines)
+        print('\n'.join(optimizer.report()))
+    if write_asm:
+        writer.close()
+    return writer.lines
+
+def VMtranslator_plan(vmfilelist, memory_sources, remove_dead_functions=False, os_bundle=None, inliner=None):
+    """
+    Returns the build steps of a program and its DeadFunctionEliminator
+    (None if remove_dead_functions is False). Each step is either
+    ('translate', vm file name, vm line list or None to read the file,
+    list of VMCommand or None to parse the lines) or ('link', class or
+    file name, list of fragments from os_bundle). Files that match a class
+    of os_bundle are linked from it, and so are the bundle classes the
+    program calls but doesn't have. If an Inliner is given, it inlines
+    the calls of the files that are translated, before dead functions
+    are removed.
+    """
+    from vmparser import VMParser
+    import os
+    if not remove_dead_functions and os_bundle is None and inliner is None:
+        return [('translate', vmfile, memory_sources.get(os.path.normpath(vmfile)), None)
+                for vmfile in vmfilelist], None
+    # the whole program is parsed first, to find the functions it calls:
+    vm_commands = {}
+    bundled = {} # {vm file name: class name} of files linked from the bundle
+    for vmfile in vmfilelist:
+        lines = memory_sources.get(os.path.normpath(vmfile))
+        if lines is None:
+            with open(vmfile, 'r') as file:
+                lines = file.read().splitlines()
+        class_name = os.path.basename(vmfile)[:-3]
+        if os_bundle is not None and os_bundle.matches(class_name, lines):
+            bundled[vmfile] = class_name
+        else:
+            vm_commands[vmfile] = VMParser(vmfile, lines = lines).commands
+    library_classes = list(bundled.values())
+    missing_classes = []
+    if os_bundle is not None:
+        # the bootstrap code calls Sys.init:
+        called_classes = {'Sys'}
+        for commands in vm_commands.values():
+            called_classes.update(command.arg1.split('.')[0] for command in commands
+                                  if command.command_type == 'C_CALL')
+        for called in os_bundle.function_calls(library_classes).values():
+            called_classes.update(function_name.split('.')[0] for function_name in called)
+        defined_classes = {os.path.basename(vmfile)[:-3] for vmfile in vmfilelist}
+        missing_classes = os_bundle.classes_needed(called_classes, defined_classes)
+        library_classes += missing_classes
+    if inliner is not None:
+        vm_commands = inliner.inline(vm_commands)
+    eliminator = None
+    kept_functions = None
+    if remove_dead_functions:
+        from deadfunctions import DeadFunctionEliminator
+        eliminator = DeadFunctionEliminator()
+        library_calls = os_bundle.function_calls(library_classes) if os_bundle is not None else None
+        vm_commands = eliminator.eliminate(vm_commands, library_calls)
+        kept_functions = set(eliminator.kept_functions)
+    steps = []
+    for vmfile in vmfilelist:
+        if vmfile in bundled:
+            steps.append(('link', vmfile, os_bundle.fragments(bundled[vmfile], kept_functions)))
+        elif vmfile in vm_commands:
+            steps.append(('translate', vmfile, [command.text for command in vm_commands[vmfile]],
+                          vm_commands[vmfile]))
+    steps.extend(('link', class_name, os_bundle.fragments(class_name, kept_functions))
+                 for class_name in missing_classes)
+    return [step for step in steps if step[0] == 'translate' or step[2]], eliminator
+
+def VMtranslator_build_os_bundle(os_folder, bundle_name, shared_calls=False):
+    """
+    Translates the .vm files of the OS in os_folder into a bundle
+    (bundle_name, see OSBundle) that programs can link instead of
+    translating the OS again. Each function is stored as its own
+    fragment, so unused functions can be left out when linking.
+    """
+    from vmcodewriter import VMCodeWriter
+    from vmparser import VMParser
+    from osbundle import os_bundle_source_hash, os_bundle_write
+    import os
+    vmfilelist = []
+    for (dirpath, dirnames, insidefilenames) in os.walk(os_folder):
+        vmfilelist.extend(os.path.join(dirpath, insidefilename) for insidefilename in insidefilenames)
+    vmfilelist = [vfile for vfile in vmfilelist if vfile[-3:] == '.vm']
+    writer = VMCodeWriter(bundle_name, shared_calls = shared_calls)
+    classes = {}
+    for vmfile in vmfilelist:
+        print(f"Coding {vmfile}.")
+        with open(vmfile, 'r') as file:
+            lines = file.read().splitlines()
+        class_name = os.path.basename(vmfile)[:-3]
+        writer.set_file_name(class_name)
+        # split the file into functions (commands before the first one have no name):
+        functions = [{'name': None, 'calls': [], 'commands': []}]
+        for command in VMParser(vmfile, lines = lines):
+            if command.command_type == 'C_FUNCTION':
+                functions.append({'name': command.arg1, 'calls': [], 'commands': []})
+            elif command.command_type == 'C_CALL' and command.arg1 not in functions[-1]['calls']:
+                functions[-1]['calls'].append(command.arg1)
+            functions[-1]['commands'].append(command)
+        if not functions[0]['commands']:
+            del functions[0]
+        for function in functions:
+            fragment_start = writer.fragment_start()
+            VMtranslator_translate(writer, function.pop('commands'))
+            function['fragment'] = writer.fragment_since(fragment_start)
+        called_classes = {function_name.split('.')[0] for function in functions for function_name in function['calls']}
+        classes[class_name] = {'source': os_bundle_source_hash(lines),
+                               'calls': sorted(called_classes - {class_name}),
+                               'functions': functions}
+    os_bundle_write(bundle_name, classes, shared_calls)
+    print(f"Wrote {len(classes)} classes to {bundle_name}.")
+
+def VMtranslator_translate(writer, parser, fuser=None):
+    """Translates every command of a VMParser (or list of VMCommand)
+    with a VMCodeWriter. If a SuperinstructionFuser is given, the runs of
+    commands it matches are translated as one. If the writer's
+    compare_branch is True, a comparison followed by an if-goto (with or
+    without a not between them) jumps on the comparison directly (see
+    VMCodeWriter.write_compare_branch)."""
+    if fuser is not None:
+        commands = fuser.fuse(list(parser), writer.current_vm_file_name)
+    else:
+        commands = list(parser)
+    position = 0
+    while position < len(commands):
+        command = commands[position]
+        position += 1
+        # add comment for current line:
+        writer.write_comment(f"Source line:{command.text}")
+        if writer.compare_branch and command.command_type == 'C_ARITHMETIC' and command.arg1 in ('eq', 'gt', 'lt'):
+            branch = commands[position:position + 2]
+            negated = bool(branch) and branch[0].command_type == 'C_ARITHMETIC' and branch[0].arg1 == 'not'
+            if negated:
+                branch = branch[1:]
+            if branch and branch[0].command_type == 'C_IF':
+                for fused_command in commands[position:position + 1 + negated]:
+                    writer.write_comment(f"Source line:{fused_command.text}")
+                writer.write_compare_branch(command.arg1, branch[0].arg1, negated)
+                position += 1 + negated
+                continue
+        match command.command_type:
+            case 'C_ARITHMETIC':
+                writer.write_arithmetic(command = command.arg1) # 'add', 'eq', etc.
+            case 'C_PUSH':
+                writer.write_push_pop(command = 'push', segment = command.arg1, index = command.arg2)
+            case 'C_POP':
+                writer.write_push_pop(command = 'pop', segment = command.arg1, index = command.arg2)
+            case 'C_LABEL':
+                writer.write_label(label = command.arg1)
+            case 'C_GOTO':
+                writer.write_goto(label = command.arg1)
+            case 'C_IF':
+                writer.write_if(label = command.arg1)
+            case 'C_FUNCTION':
+                writer.write_function(function_name = command.arg1, num_locals = command.arg2)
+            case 'C_RETURN':
+                writer.write_return()
+            case 'C_CALL':
+                writer.write_call(function_name = command.arg1, num_args = command.arg2)
+            case 'C_SUPERINSTRUCTION':
+                writer.write_superinstruction(command)
+    writer.flush_top_of_stack()
 
 if __name__ == '__main__':
-    import sys
-    filearg = sys.argv[1]
-    VMtranslator_main(filearg)
+    import argparse
+    from peephole import PATTERNS
+    from superinstructions import PATTERNS as SUPERINSTRUCTIONS
+    from inliner import BUDGET
+    argparser = argparse.ArgumentParser(description = 'Translate .vm files to one .asm file.')
+    argparser.add_argument('filename', help = '.vm file or folder of .vm files')
+    argparser.add_argument('--peephole', nargs = '?', const = ','.join(PATTERNS),
+                           help = 'optimize the assembly with a comma separated list of patterns '
+                                  f'(default all: {",".join(PATTERNS)})')
+    argparser.add_argument('--shared-calls', action = 'store_true',
+                           help = 'use one shared routine for all calls and one for all returns, to save ROM')
+    argparser.add_argument('--remove-dead-functions', action = 'store_true',
+                           help = 'only translate the functions reachable from Sys.init')
+    argparser.add_argument('--superinstructions', nargs = '?', const = ','.join(SUPERINSTRUCTIONS),
+                           help = 'translate common runs of VM commands as one, with a comma separated list '
+                                  f'of patterns (default all: {",".join(SUPERINSTRUCTIONS)})')
+    argparser.add_argument('--top-of-stack-in-d', action = 'store_true',
+                           help = 'keep the top of the stack in the D register, to run fewer instructions')
+    argparser.add_argument('--inline', nargs = '?', type = int, const = BUDGET, metavar = 'BUDGET',
+                           help = 'replace calls to small functions with their body, adding at most BUDGET '
+                                  f'VM commands (default {BUDGET})')
+    argparser.add_argument('--compare-branch', action = 'store_true',
+                           help = 'jump on a comparison followed by if-goto directly, without building true/false')
+    argparser.add_argument('--os-bundle', metavar = 'BUNDLE',
+                           help = 'link the OS classes from a bundle built with --build-os-bundle')
+    argparser.add_argument('--build-os-bundle', metavar = 'BUNDLE',
+                           help = 'translate the OS .vm files in filename (a folder) into a bundle, '
+                                  'instead of translating a program')
+    args = argparser.parse_args()
+    if args.peephole is not None:
+        args.peephole = args.peephole.split(',')
+    if args.superinstructions is not None:
+        args.superinstructions = args.superinstructions.split(',')
+    if args.build_os_bundle is not None:
+        VMtranslator_build_os_bundle(args.filename, args.build_os_bundle, shared_calls = args.shared_calls)
+    else:
+        os_bundle = None
+        if args.os_bundle is not None:
+            from osbundle import OSBundle
+            os_bundle = OSBundle(args.os_bundle, shared_calls = args.shared_calls)
+        VMtranslator_main(args.filename, peephole = args.peephole, shared_calls = args.shared_calls,
+                          remove_dead_functions = args.remove_dead_functions, os_bundle = os_bundle,
+                          superinstructions = args.superinstructions, top_of_stack_in_d = args.top_of_stack_in_d,
+                          inline = args.inline, compare_branch = args.compare_branch)
@@ -0,0 +1,90 @@
+### Contains the dead function elimination for the VM translator ###
+
+class DeadFunctionEliminator():
+    """Removes the functions a program never calls, e.g. unused OS
+    functions. The functions reachable from Sys.init through call
+    commands are kept, the others are dropped. Jack has no function
+    pointers, so the call commands are all the ways a function can be
+    reached. Commands before the first function of a file are kept."""
+
+    def __init__(self, root='Sys.init'):
+        """Initializes an eliminator that keeps the functions reachable from root."""
+        self.root = root
+        self.kept_functions = []
+        self.dropped_functions = []
+        self.dropped_commands = {} # {vm file name: dropped VMCommands}
+        self.dropped_library_functions = []
+
+    def eliminate(self, vm_commands, library_calls=None) -> dict:
+        """Takes {vm file name: list of VMCommand} and returns the same
+        with the unreachable functions removed. Files left empty are left
+        out. library_calls is {function name: called function names} for
+        functions linked from elsewhere (see OSBundle). The reachable ones
+        are added to kept_functions, the others to
+        dropped_library_functions. If root isn't defined nothing is
+        removed, as the bootstrap code would have nothing to call."""
+        if library_calls is None:
+            library_calls = {}
+        # Split the files into functions and find the calls of each:
+        functions = {} # {function name: (vm file name, list of VMCommand)}
+        headers = {} # {vm file name: commands before the first function}
+        calls = {} # {function name: called function names}
+        for vmfile, commands in vm_commands.items():
+            headers[vmfile] = []
+            function_commands = headers[vmfile]
+            function_name = None
+            for command in commands:
+                if command.command_type == 'C_FUNCTION':
+                    function_name = command.arg1
+                    function_commands = []
+                    functions[function_name] = (vmfile, function_commands)
+                    calls[function_name] = set()
+                elif command.command_type == 'C_CALL' and function_name is not None:
+                    calls[function_name].add(command.arg1)
+                function_commands.append(command)
+        for function_name, called in library_calls.items():
+            functions.setdefault(function_name, (None, []))
+            calls[function_name] = set(called)
+        if self.root not in functions:
+            self.kept_functions = list(functions)
+            return vm_commands
+        # Mark the functions reachable from root:
+        reachable = {self.root}
+        to_visit = [self.root]
+        while to_visit:
+            for callee in calls[to_visit.pop()]:
+                # calls to undefined functions are left for the assembler to report
+                if callee in functions and callee not in reachable:
+                    reachable.add(callee)
+                    to_visit.append(callee)
+        # Keep the reachable functions, in their original order:
+        kept_commands = {vmfile: list(header) for vmfile, header in headers.items()}
+        for function_name, (vmfile, commands) in functions.items():
+            if function_name in reachable:
+                self.kept_functions.append(function_name)
+                if vmfile is not None:
+                    kept_commands[vmfile].extend(commands)
+            else:
+                self.dropped_functions.append(function_name)
+                if vmfile is None:
+                    self.dropped_library_functions.append(function_name)
+                else:
+                    self.dropped_commands.setdefault(vmfile, []).extend(commands)
+        return {vmfile: commands for vmfile, commands in kept_commands.items() if commands}
+
+    def report(self, rom_saved) -> list:
+        """Returns lines listing the dropped functions and the ROM saved
+        (rom_saved, the number of instructions they translate to)."""
+        report_lines = [f'Dead functions: {len(self.dropped_functions)} of '
+                        f'{len(self.kept_functions) + len(self.dropped_functions)} functions dropped, '
+                        f'{rom_saved} instructions of ROM saved.']
+        if self.root not in self.kept_functions:
+            report_lines.append(f'    {self.root} is not defined, no functions dropped.')
+        # one line per class:
+        classes = {}
+        for function_name in self.dropped_functions:
+            class_name, _, name = function_name.partition('.')
+            classes.setdefault(class_name, []).append(name)
+        for class_name, names in classes.items():
+            report_lines.append(f'    {class_name}: {", ".join(names)}')
+        return report_lines
@@ -0,0 +1,150 @@
+### Contains the function inliner for the VM translator ###
+
+# Largest body (VM commands between function and return) that is inlined:
+MAX_SIZE = 8
+
+# Default number of VM commands inlining may add to the program:
+BUDGET = 500
+
+class Inliner():
+    """Replaces calls to small functions, e.g. getters, setters and
+    wrappers, with the body of the function, so the call and return
+    frames are skipped. Works on the VM code of the whole program, across
+    classes. At each inlined call the arguments are popped into extra
+    locals of the caller, and the locals of the callee are more extra
+    locals, set to 0. If the callee sets pointer 0 or 1, the caller's
+    pointer is saved in an extra local and restored after the body.
+    The extra locals are shared by all inlined calls in a caller, as
+    they never overlap.
+    A function can be inlined if its body has at most max_size commands,
+    ends with its only return, has no labels (so no branches) and doesn't
+    call itself. Functions using static are only inlined into their own
+    file, as statics belong to the file. Bodies are inlined as they were
+    written, calls inside them are not inlined again. Like the Jack
+    compiler's code, the body must leave only its return value on the
+    stack. Each inlined call adds commands to the program, calls are
+    inlined in program order until budget commands have been added."""
+
+    def __init__(self, max_size=MAX_SIZE, budget=BUDGET):
+        """Initializes an inliner for bodies of up to max_size commands,
+        adding at most budget commands to the program."""
+        self.max_size = max_size
+        self.budget = budget
+        self.growth = 0 # commands added so far
+        self.inlined_calls = {} # {function name: number of calls inlined}
+        self.skipped_calls = 0 # calls to inlinable functions left for the budget
+
+    def inline(self, vm_commands) -> dict:
+        """Takes {vm file name: list of VMCommand} and returns the same
+        with the calls to small functions inlined."""
+        # find the functions that can be inlined:
+        inlinable = {} # {function name: (vm file name, num_locals, body)}
+        for vmfile, commands in vm_commands.items():
+            for position, command in enumerate(commands):
+                if command.command_type == 'C_FUNCTION':
+                    body = self._body(commands, position)
+                    if body is not None:
+                        inlinable[command.arg1] = (vmfile, command.arg2, body)
+        output = {}
+        for vmfile, commands in vm_commands.items():
+            output[vmfile] = []
+            function_position = None # position of the caller's function command in output
+            extra_locals = 0
+            for command in commands:
+                if command.command_type == 'C_FUNCTION':
+                    self._add_locals(output[vmfile], function_position, extra_locals)
+                    function_position = len(output[vmfile])
+                    extra_locals = 0
+                    caller = command.arg1
+                elif (command.command_type == 'C_CALL' and command.arg1 in inlinable
+                      and function_position is not None and command.arg1 != caller):
+                    callee_file, num_locals, body = inlinable[command.arg1]
+                    uses_static = any(body_command.arg1 == 'static' for body_command in body)
+                    if not uses_static or callee_file == vmfile:
+                        base = output[vmfile][function_position].arg2
+                        inlined = self._inlined_call(command.arg2, num_locals, body, base)
+                        if self.growth + len(inlined) - 1 <= self.budget:
+                            self.growth += len(inlined) - 1
+                            self.inlined_calls[command.arg1] = self.inlined_calls.get(command.arg1, 0) + 1
+                            extra_locals = max(extra_locals, self._extra_locals(command.arg2, num_locals, body))
+                            output[vmfile].extend(inlined)
+                            continue
+                        self.skipped_calls += 1
+                output[vmfile].append(command)
+            self._add_locals(output[vmfile], function_position, extra_locals)
+        return output
+
+    def report(self) -> list:
+        """Returns lines listing the inlined functions and the commands added."""
+        report_lines = [f'Inlining: {sum(self.inlined_calls.values())} calls to {len(self.inlined_calls)} functions '
+                        f'inlined, {self.growth} of {self.budget} VM commands of budget used.']
+        if self.skipped_calls:
+            report_lines.append(f'    {self.skipped_calls} calls not inlined, over the budget.')
+        for function_name, count in self.inlined_calls.items():
+            report_lines.append(f'    {function_name}: {count} calls')
+        return report_lines
+
+    def _body(self, commands, position):
+        # Returns the body of the function starting at position (without
+        # the function and return commands) if it can be inlined, else None.
+        body = []
+        for command in commands[position + 1:]:
+            match command.command_type:
+                case 'C_RETURN':
+                    return body
+                case 'C_FUNCTION' | 'C_LABEL' | 'C_GOTO' | 'C_IF':
+                    return None
+                case 'C_CALL' if command.arg1 == commands[position].arg1:
+                    return None
+            body.append(command)
+            if len(body) > self.max_size:
+                return None
+        return None
+
+    def _extra_locals(self, num_args, num_locals, body):
+        # Number of caller locals an inlined call uses.
+        return num_args + num_locals + len(self._saved_pointers(body))
+
+    def _saved_pointers(self, body):
+        # The pointers (0 = THIS, 1 = THAT) the body sets, in order.
+        return sorted({command.arg2 for command in body
+                       if command.command_type == 'C_POP' and command.arg1 == 'pointer'})
+
+    def _inlined_call(self, num_args, num_locals, body, base):
+        # Returns the commands replacing a call. The extra locals start at
+        # local base: arguments, then the callee's locals, then saved pointers.
+        inlined = []
+        for index in reversed(range(num_args)):
+            inlined.append(vm_command('pop', 'local', base + index))
+        for index in range(num_locals):
+            inlined.append(vm_command('push', 'constant', 0))
+            inlined.append(vm_command('pop', 'local', base + num_args + index))
+        saved_pointers = self._saved_pointers(body)
+        save_base = base + num_args + num_locals
+        for offset, pointer in enumerate(saved_pointers):
+            inlined.append(vm_command('push', 'pointer', pointer))
+            inlined.append(vm_command('pop', 'local', save_base + offset))
+        for command in body:
+            if command.command_type in ('C_PUSH', 'C_POP') and command.arg1 in ('argument', 'local'):
+                index = base + command.arg2 if command.arg1 == 'argument' else base + num_args + command.arg2
+                command = vm_command('push' if command.command_type == 'C_PUSH' else 'pop', 'local', index)
+            inlined.append(command)
+        # the return value is on top of the stack, restore the pointers under it:
+        for offset, pointer in enumerate(saved_pointers):
+            inlined.append(vm_command('push', 'local', save_base + offset))
+            inlined.append(vm_command('pop', 'pointer', pointer))
+        return inlined
+
+    def _add_locals(self, commands, function_position, extra_locals):
+        # Adds extra_locals to the function command at function_position.
+        from vmparser import VMCommand
+        if function_position is not None and extra_locals:
+            function = commands[function_position]
+            num_locals = function.arg2 + extra_locals
+            commands[function_position] = VMCommand('C_FUNCTION', function.arg1, num_locals,
+                                                     f'function {function.arg1} {num_locals}')
+
+def vm_command(command, segment, index):
+    """Returns the VMCommand for push or pop (command) segment index."""
+    from vmparser import VMCommand
+    return VMCommand('C_PUSH' if command == 'push' else 'C_POP', segment, index, f'{command} {segment} {index}')
@@ -0,0 +1,84 @@
+### Contains the pre-translated OS bundle for the VM translator ###
+
+# A bundle holds the assembly of each function of the OS classes as a
+# relocatable fragment (see VMCodeWriter.fragment_since), so programs can
+# link the OS instead of translating it again. Bundles are built with
+# VMtranslator.py OSFolder --build-os-bundle Xxx.json.
+
+class OSBundle():
+    """A bundle of pre-translated OS classes, stored as a .json file.
+    A bundle is only valid for the translator source code and the
+    options (shared_calls) it was built with."""
+
+    def __init__(self, bundle_name, shared_calls=False):
+        """Loads the bundle in bundle_name. Raises ValueError if it was built
+        by another version of the translator or with other options."""
+        import json
+        self.bundle_name = bundle_name
+        with open(bundle_name, 'r') as bundle_file:
+            bundle = json.load(bundle_file)
+        if bundle['version'] != os_bundle_version(shared_calls):
+            raise ValueError(f'{bundle_name} was built by another version of the VM translator '
+                             f'or with other options, rebuild it with --build-os-bundle.')
+        self.classes = bundle['classes']
+        self.functions = {function['name']: function for os_class in self.classes.values()
+                          for function in os_class['functions'] if function['name'] is not None}
+
+    def matches(self, class_name, lines) -> bool:
+        """True if the bundle has class_name built from these .vm lines."""
+        return class_name in self.classes and self.classes[class_name]['source'] == os_bundle_source_hash(lines)
+
+    def classes_needed(self, called_classes, defined_classes) -> list:
+        """Returns the bundle classes to link for a program that calls
+        called_classes and defines defined_classes (class names): the
+        called classes it doesn't define, and the classes they call."""
+        needed = []
+        to_visit = sorted(called_classes)
+        while to_visit:
+            class_name = to_visit.pop(0)
+            if class_name in defined_classes or class_name in needed or class_name not in self.classes:
+                continue
+            needed.append(class_name)
+            to_visit.extend(self.classes[class_name]['calls'])
+        return needed
+
+    def function_calls(self, class_names) -> dict:
+        """Returns {function name: called function names} for the
+        functions of class_names."""
+        return {function['name']: function['calls'] for class_name in class_names
+                for function in self.classes[class_name]['functions'] if function['name'] is not None}
+
+    def fragments(self, class_name, kept_functions=None) -> list:
+        """Returns the fragments of the functions of class_name, or only
+        of those in kept_functions if it is given."""
+        return [function['fragment'] for function in self.classes[class_name]['functions']
+                if kept_functions is None or function['name'] is None or function['name'] in kept_functions]
+
+def os_bundle_version(shared_calls) -> str:
+    """Returns a hash of the VM translator source code and the options,
+    as the fragments depend on both."""
+    import hashlib
+    import os
+    version_hash = hashlib.sha256(f'shared_calls={shared_calls}'.encode())
+    translator_dir = os.path.dirname(os.path.abspath(__file__))
+    for source_name in sorted(os.listdir(translator_dir)):
+        if source_name[-3:] == '.py':
+            with open(os.path.join(translator_dir, source_name), 'rb') as source_file:
+                version_hash.update(source_file.read())
+    return version_hash.hexdigest()
+
+def os_bundle_source_hash(lines) -> str:
+    """Returns the hash of the lines of a .vm file."""
+    import hashlib
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+def os_bundle_write(bundle_name, classes, shared_calls):
+    """Writes a bundle. classes is {class name: {'source': source hash,
+    'calls': called class names, 'functions': [{'name', 'calls',
+    'fragment'}]}}, in the order the classes are linked."""
+    import json
+    import os
+    temp_name = bundle_name + '.tmp'
+    with open(temp_name, 'w') as bundle_file:
+        json.dump({'version': os_bundle_version(shared_calls), 'classes': classes}, bundle_file)
+    os.replace(temp_name, bundle_name)
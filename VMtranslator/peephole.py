@@ -0,0 +1,163 @@
+### Contains the peephole optimizer for the assembly written by VMCodeWriter ###
+
+# VMCodeWriter templates, without comments and spaces:
+PUSH_D = ('@SP', 'A=M', 'M=D', '@SP', 'M=M+1') # _writeDtostack, end of push
+POP_D = ('@SP', 'A=M', 'A=A-1', 'D=M', '@SP', 'M=M-1') # _gety, start of pop
+GET_X_AND_Y = ('@SP', 'A=M', 'A=A-1', 'D=M', '@SP', 'M=M-1', 'M=M-1', 'A=M', 'A=M') # _getxandy
+SEGMENTS = ('@LCL', '@ARG', '@THIS', '@THAT')
+
+# Pattern names. The stack template patterns are matched in a first pass,
+# as removing single loads would break up the templates:
+TEMPLATE_PATTERNS = ('push_pop', 'push_getxandy', 'push_pop_segment')
+LOAD_PATTERNS = ('redundant_load', 'dead_load')
+PATTERNS = TEMPLATE_PATTERNS + LOAD_PATTERNS
+
+class PeepholeOptimizer():
+    """Removes redundant instructions from the assembly lines written by
+    VMCodeWriter. Each pattern is matched against the end of the output
+    as instructions are added, so instructions exposed by one pattern are
+    matched again. The stack template patterns and the load patterns are
+    matched in two passes. Comment lines are kept but skipped when matching.
+    Labels end a match, as code can jump to them: no pattern matches
+    across a label, and what A holds is forgotten at each label.
+    Patterns (see PATTERNS):
+        push_pop: push D then pop to D (e.g. push constant, pop temp)
+        push_getxandy: push D then take x and y off the stack (binary ops)
+        push_pop_segment: push D then pop to local/argument/this/that
+        redundant_load: @X when A already holds X
+        dead_load: A set and then set again before it is used
+    """
+
+    def __init__(self, patterns=PATTERNS):
+        """Initializes an optimizer using the named patterns."""
+        for pattern in patterns:
+            if pattern not in PATTERNS:
+                raise ValueError(f'Unknown peephole pattern {pattern}. Patterns are: {", ".join(PATTERNS)}')
+        self.passes = [[(pattern, getattr(self, f'_match_{pattern}')) for pattern in pass_patterns
+                        if pattern in patterns]
+                       for pass_patterns in (TEMPLATE_PATTERNS, LOAD_PATTERNS)]
+        self.savings = {pattern: 0 for pattern in PATTERNS if pattern in patterns}
+        self.instructions_before = 0
+        self.instructions_after = 0
+
+    def optimize(self, lines) -> list:
+        """Returns the optimized list of assembly lines."""
+        from vmcodewriter import count_instructions
+        self.instructions_before += count_instructions(lines)
+        for matchers in self.passes:
+            self.matchers = matchers
+            self.output = []
+            self.code = [] # indices of the instructions in self.output
+            for line in lines:
+                instruction = line.split('//')[0].replace(' ', '')
+                if instruction == '':
+                    self.output.append(line)
+                else:
+                    self._add_instruction(instruction)
+            lines = self.output
+        self.instructions_after += count_instructions(lines)
+        return lines
+
+    def report(self) -> list:
+        """Returns lines describing the instructions saved by each pattern."""
+        report_lines = [f'Peephole optimizer: {self.instructions_before} -> '
+                        f'{self.instructions_after} instructions']
+        for pattern, saved in self.savings.items():
+            report_lines.append(f'    {pattern}: -{saved}')
+        return report_lines
+
+    def _add_instruction(self, instruction):
+        """Adds an instruction to the output and replaces the end of the
+        output if a pattern matches it."""
+        self.code.append(len(self.output))
+        self.output.append(instruction)
+        for pattern, matcher in self.matchers:
+            match = matcher()
+            if match is not None:
+                count, replacement = match
+                self.savings[pattern] += count - len(replacement)
+                for output_idx in reversed(self.code[-count:]):
+                    del self.output[output_idx]
+                del self.code[-count:]
+                for new_instruction in replacement:
+                    self._add_instruction(new_instruction)
+                return
+
+    def _tail(self, count):
+        """Returns the last count instructions, or () if there are fewer or
+        if one of them is a label. Code can jump to a label from anywhere,
+        so no pattern may match across one."""
+        if len(self.code) < count:
+            return ()
+        tail = tuple(self.output[output_idx] for output_idx in self.code[-count:])
+        if any(instruction[0] == '(' for instruction in tail):
+            return ()
+        return tail
+
+    def _known_a(self):
+        """Returns the @ instruction that A holds before the last
+        instruction, or None if it isn't known. The state is reset at
+        every label, where A is whatever the jumping code left in it."""
+        for output_idx in reversed(self.code[:-1]):
+            instruction = self.output[output_idx]
+            if instruction[0] == '@':
+                return instruction
+            if instruction[0] == '(':
+                return None
+            if '=' in instruction and 'A' in instruction.split('=')[0]:
+                return None
+        return None
+
+    # Each matcher checks the end of the output. If it matches, it returns
+    # (number of instructions to remove, list of instructions to add).
+    def _match_push_pop(self):
+        # The value pushed from D is popped back into D. The instruction
+        # after the pair is part of the match, to check it doesn't use A
+        # (which was left pointing at SP).
+        tail = self._tail(12)
+        if tail[:11] == PUSH_D + POP_D and not reads_a(tail[11]):
+            return (12, [tail[11]])
+        return None
+
+    def _match_push_getxandy(self):
+        # y was just pushed from D, so it is still in D. Only x, below
+        # it, is taken off the stack.
+        tail = self._tail(14)
+        if tail == PUSH_D + GET_X_AND_Y:
+            return (14, ['@SP', 'M=M-1', 'A=M', 'A=M'])
+        return None
+
+    def _match_push_pop_segment(self):
+        # The pop computes the segment address into R13 before it takes
+        # the value off the stack. The value is kept in R14 instead.
+        tail = self._tail(21)
+        if (tail[:5] == PUSH_D and tail[5] in SEGMENTS and tail[7][1:].isdecimal()
+                and tail[6:7] + tail[8:] == ('D=M', 'A=D+A', 'D=A', '@R13', 'M=D') + POP_D + ('@R13', 'A=M', 'M=D')):
+            return (21, ['@R14', 'M=D', tail[5], 'D=M', tail[7], 'D=D+A', '@R13', 'M=D',
+                         '@R14', 'D=M', '@R13', 'A=M', 'M=D'])
+        return None
+
+    def _match_redundant_load(self):
+        tail = self._tail(1)
+        if tail and tail[0][0] == '@' and tail[0] == self._known_a():
+            return (1, [])
+        return None
+
+    def _match_dead_load(self):
+        tail = self._tail(2)
+        if not tail or tail[1][0] != '@':
+            return None
+        previous = tail[0]
+        if previous[0] == '@' or (previous[:2] == 'A=' and ';' not in previous):
+            return (2, [tail[1]])
+        return None
+
+def reads_a(instruction) -> bool:
+    """True if an instruction may depend on the value of A (labels are
+    assumed to, as the code that jumps to them isn't known)."""
+    if instruction[0] == '@':
+        return False
+    if instruction[0] == '(' or ';' in instruction:
+        return True
+    dest, comp = instruction.split('=')
+    return 'M' in dest or 'A' in comp or 'M' in comp
@@ -0,0 +1,150 @@
+### Contains the superinstruction fusion stage of the VM translator ###
+
+# Pattern names, matched in this order (longest first):
+PATTERNS = ('increment', 'copy', 'add_constant', 'push_constant')
+
+# Segments the fused patterns read and write (not constant):
+MEMORY_SEGMENTS = ('local', 'argument', 'this', 'that', 'static', 'temp', 'pointer')
+
+class Superinstruction():
+    """A run of VM commands that VMCodeWriter.write_superinstruction
+    translates as one. name is one of PATTERNS, commands the VMCommands it
+    replaces and args the arguments of the pattern (see
+    SuperinstructionFuser). command_type and text make it look like a
+    VMCommand to VMtranslator_translate."""
+    __slots__ = ('name', 'commands', 'args', 'command_type', 'text')
+
+    def __init__(self, name, commands, args):
+        self.name = name
+        self.commands = commands
+        self.args = args
+        self.command_type = 'C_SUPERINSTRUCTION'
+        self.text = ' / '.join(command.text for command in commands)
+
+    def __repr__(self):
+        return f'Superinstruction({self.name}, {self.text!r})'
+
+class SuperinstructionFuser():
+    """Replaces common runs of VM commands with Superinstructions, which
+    are translated to shorter hand written assembly. Labels are never
+    part of a run, so no jump can land inside one.
+    Patterns (see PATTERNS):
+        increment: push S i, push constant c, [neg,] add, pop S i
+            args (segment, index, constant, '+' or '-')
+        copy: push S i (or push constant c), pop T j
+            args (source segment, source index, segment, index)
+        add_constant: push constant c, [neg,] add
+            args (constant, '+' or '-')
+        push_constant: push constant 0 or 1, or push constant 1, neg
+            args (0, 1 or -1,)
+    """
+
+    def __init__(self, patterns=PATTERNS):
+        """Initializes a fuser using the named patterns."""
+        for pattern in patterns:
+            if pattern not in PATTERNS:
+                raise ValueError(f'Unknown superinstruction {pattern}. Superinstructions are: {", ".join(PATTERNS)}')
+        self.matchers = [(pattern, getattr(self, f'_match_{pattern}')) for pattern in PATTERNS if pattern in patterns]
+        self.counts = {pattern: 0 for pattern in PATTERNS if pattern in patterns}
+        self.savings = {pattern: 0 for pattern in PATTERNS if pattern in patterns}
+        self.sizes = {} # {(pattern, file name, command texts): instructions saved}
+
+    def fuse(self, commands, file_name) -> list:
+        """Returns commands (a list of VMCommand from the .vm file
+        file_name) with the runs matched by the patterns replaced by
+        Superinstructions."""
+        output = []
+        position = 0
+        while position < len(commands):
+            for pattern, matcher in self.matchers:
+                match = matcher(commands, position)
+                if match is not None:
+                    count, args = match
+                    superinstruction = Superinstruction(pattern, commands[position:position + count], args)
+                    output.append(superinstruction)
+                    self.counts[pattern] += 1
+                    self.savings[pattern] += self._saving(superinstruction, file_name)
+                    position += count
+                    break
+            else:
+                output.append(commands[position])
+                position += 1
+        return output
+
+    def report(self) -> list:
+        """Returns lines with the number of times each pattern was used
+        and the instructions it saved."""
+        report_lines = [f'Superinstructions: {sum(self.counts.values())} fused, '
+                        f'{sum(self.savings.values())} instructions of ROM saved']
+        for pattern in self.counts:
+            report_lines.append(f'    {pattern}: {self.counts[pattern]} times, -{self.savings[pattern]}')
+        return report_lines
+
+    def _saving(self, superinstruction, file_name):
+        # Translates the superinstruction and its commands on their own to
+        # measure it. Results are kept, as the same runs repeat a lot.
+        key = (superinstruction.name, file_name, superinstruction.text)
+        if key not in self.sizes:
+            from vmcodewriter import VMCodeWriter, count_instructions
+            writer = VMCodeWriter('')
+            writer.set_file_name(file_name)
+            for command in superinstruction.commands:
+                if command.command_type == 'C_ARITHMETIC':
+                    writer.write_arithmetic(command.arg1)
+                else:
+                    writer.write_push_pop('push' if command.command_type == 'C_PUSH' else 'pop',
+                                          command.arg1, command.arg2)
+            separate_size = count_instructions(writer.lines)
+            writer.lines = []
+            writer.write_superinstruction(superinstruction)
+            self.sizes[key] = separate_size - count_instructions(writer.lines)
+        return self.sizes[key]
+
+    # Each matcher checks the commands starting at position. If they
+    # match, it returns (number of commands, args).
+    def _match_increment(self, commands, position):
+        window = commands[position:position + 5]
+        if len(window) < 4 or not is_push(window[0], MEMORY_SEGMENTS) or not is_push(window[1], ('constant',)):
+            return None
+        if is_arithmetic(window[2], 'add'):
+            sign, pop = '+', window[3]
+        elif is_arithmetic(window[2], 'neg') and len(window) == 5 and is_arithmetic(window[3], 'add'):
+            sign, pop = '-', window[4]
+        else:
+            return None
+        if pop.command_type == 'C_POP' and (pop.arg1, pop.arg2) == (window[0].arg1, window[0].arg2):
+            return (4 if sign == '+' else 5, (pop.arg1, pop.arg2, window[1].arg2, sign))
+        return None
+
+    def _match_copy(self, commands, position):
+        window = commands[position:position + 2]
+        if (len(window) == 2 and is_push(window[0], MEMORY_SEGMENTS + ('constant',))
+                and window[1].command_type == 'C_POP'):
+            return (2, (window[0].arg1, window[0].arg2, window[1].arg1, window[1].arg2))
+        return None
+
+    def _match_add_constant(self, commands, position):
+        window = commands[position:position + 3]
+        if not window or not is_push(window[0], ('constant',)):
+            return None
+        if len(window) >= 2 and is_arithmetic(window[1], 'add'):
+            return (2, (window[0].arg2, '+'))
+        if len(window) == 3 and is_arithmetic(window[1], 'neg') and is_arithmetic(window[2], 'add'):
+            return (3, (window[0].arg2, '-'))
+        return None
+
+    def _match_push_constant(self, commands, position):
+        window = commands[position:position + 2]
+        if not is_push(window[0], ('constant',)) or window[0].arg2 > 1:
+            return None
+        if window[0].arg2 == 1 and len(window) == 2 and is_arithmetic(window[1], 'neg'):
+            return (2, (-1,))
+        return (1, (window[0].arg2,))
+
+def is_push(command, segments) -> bool:
+    """True if command pushes from one of segments."""
+    return command.command_type == 'C_PUSH' and command.arg1 in segments
+
+def is_arithmetic(command, operation) -> bool:
+    """True if command is the arithmetic command operation ('add', ...)."""
+    return command.command_type == 'C_ARITHMETIC' and command.arg1 == operation
@@ -4,9 +4,15 @@ class VMCodeWriter():
     """Write a .asm file line by line.
     Takes a .asm file name when initialized.
     Returns object which provides functions for writing 
-    assembly commands to file from vm code."""
+    assembly commands to file from vm code.
+    If shared_calls is True, calls and returns jump to one shared
+    $$CALL and $$RETURN routine instead of being written out in full.
+    If top_of_stack_in_d is True, the value on top of the stack is kept
+    in D instead of RAM where possible (see Top of stack in D).
+    If compare_branch is True, a comparison followed by if-goto is
+    translated as one jump (see write_compare_branch)."""
     
-    def __init__(self,output_file_name):
+    def __init__(self,output_file_name,shared_calls=False,top_of_stack_in_d=False,compare_branch=False):
         # initialize the stack?
         # SP is SP special symbol in assembly so '@SP'
         # then implement logic to increment or decrement SP
@@ -15,6 +21,10 @@ class VMCodeWriter():
         self.uniquefunctionreturn = 222 # necessary for recursion or labels won't be unique
         self.output_file_name = output_file_name
         self.current_function_name = ''
+        self.shared_calls = shared_calls
+        self.top_of_stack_in_d = top_of_stack_in_d
+        self.compare_branch = compare_branch
+        self.top_in_d = False # True while the top of the stack is in D, not RAM
 
     def set_file_name(self,current_vm_file_name):
         """Set name of the current .vm file. Used internally by VM."""
@@ -40,26 +50,71 @@ class VMCodeWriter():
         # These values were expected on the stack since sys.init never
         # finishes running. Really though, these shouldn't be necessary since
         # sys.init never returns to anything. (instead of @Sys.init, 0;JMP)
+        if self.shared_calls:
+            # Sys.init never returns, so the routines go after its call:
+            self._write_shared_call_routines()
 
     def write_label(self,label):
         """Writes assembly for label command."""
+        self.flush_top_of_stack() # code jumping here has the whole stack in RAM
         self.lines.append(f"({self.current_function_name}${label})")
 
     def write_goto(self,label):
         """Writes assembly for goto command."""
+        self.flush_top_of_stack()
         self.lines.extend([f"@{self.current_function_name}${label}",
                                "0;JMP"])
 
     def write_if(self,label):
         """Writes assembly for if-goto command."""
-        self._gety() # pops top item from stack and puts in D
+        if self.top_of_stack_in_d:
+            self._load_top_of_stack() # condition in D, the rest of the stack in RAM
+            self.top_in_d = False
+        else:
+            self._gety() # pops top item from stack and puts in D
         self.lines.extend([f"@{self.current_function_name}${label}",
                                "D;JNE"]) # jump only if D != 0
 
+    def write_compare_branch(self,comparison,label,negated=False):
+        """Writes assembly for a comparison (eq, gt or lt) followed by
+        if-goto label, or by not and if-goto label if negated. Jumps on
+        x-y directly instead of building -1/0 and testing it."""
+        jumps = {'eq':('JEQ','JNE'),'gt':('JGT','JLE'),'lt':('JLT','JGE')}
+        if self.top_of_stack_in_d:
+            self._load_top_of_stack() # y in D
+        else:
+            self.lines.extend(["@SP",
+                               "AM=M-1",
+                               "D=M"])
+        self.lines.extend(["@SP",
+                           "AM=M-1",
+                           "D=M-D",
+                           f"@{self.current_function_name}${label}",
+                           f"D;{jumps[comparison][negated]}"])
+        self.top_in_d = False
+
     def write_call(self,function_name: str,num_args: int):
         """Writes assembly for call command. Must handle
         setting up the stack and built-ins(LCL,ARG, etc.) 
         for each routine."""
+        self.flush_top_of_stack() # arguments must be in RAM
+        if self.shared_calls:
+            # R13 = num_args, R14 = function address, D = return address:
+            self.lines.extend([f"@{num_args}",
+                               "D=A",
+                               "@R13",
+                               "M=D",
+                               f"@{function_name}",
+                               "D=A",
+                               "@R14",
+                               "M=D",
+                               f"@returnaddressfrom.{function_name}{self.uniquefunctionreturn}",
+                               "D=A",
+                               "@$$CALL",
+                               "0;JMP",
+                               f"(returnaddressfrom.{function_name}{self.uniquefunctionreturn})"])
+            self.uniquefunctionreturn += 1
+            return
         # push return-address (seperately because value in A not M):
         self.lines.extend([f"@returnaddressfrom.{function_name}{self.uniquefunctionreturn}","D=A"])
         self._writeDtostack()
@@ -101,7 +156,15 @@ class VMCodeWriter():
         """Writes assembly for call command. Must handle
         restoring the stack and built-ins(LCL,ARG, etc.) 
         for the calling(outer) routine."""
+        self.flush_top_of_stack()
+        if self.shared_calls:
+            self.lines.extend(["@$$RETURN",
+                               "0;JMP"])
+        else:
+            self._write_return_frame()
 
+    def _write_return_frame(self):
+        """Writes the assembly that returns from the current function."""
         # set LCL address to temp var FRAME: 
         command_list = ["@LCL",
                             "D=M", # was D=A                                             **
@@ -179,8 +242,21 @@ class VMCodeWriter():
         Should include function label, etc.."""
         # save the name (used by write_label,write_if,write_goto):
         self.current_function_name = function_name 
+        self.flush_top_of_stack()
         # Add label for beginning of function:
         self.lines.append(f"({function_name})")
+        if self.top_of_stack_in_d and num_locals > 0:
+            # locals are addressed through LCL, so they go to RAM:
+            self.lines.extend(["@SP",
+                               "A=M",
+                               "M=0"])
+            for i in range(num_locals - 1):
+                self.lines.extend(["A=A+1",
+                                   "M=0"])
+            self.lines.extend(["D=A+1",
+                               "@SP",
+                               "M=D"])
+            return
         # Initialize num_locals number of variables to
         # stack with value of 0:
         for i in range(num_locals):
@@ -193,6 +269,9 @@ class VMCodeWriter():
         place them in A,D,M as appropriate. Perform the 
         selected operation. Then move result from D
         onto the top of the stack."""
+        if self.top_of_stack_in_d:
+            self._write_arithmetic_top_in_d(command)
+            return
         # add a comment:
         self.lines.append(f"// write_arithmetic:{command}:")
         match command:
@@ -235,6 +314,9 @@ class VMCodeWriter():
 
     def write_push_pop(self,command: str, segment: str, index: int):
         """Write assembly for push and pop commands."""
+        if self.top_of_stack_in_d:
+            self._write_push_pop_top_in_d(command, segment, index)
+            return
         # add a comment:
         self.lines.append(f"// write_push_pop:{command} {segment} {index}:")
         # implement push constant x:
@@ -376,3 +458,322 @@ class VMCodeWriter():
     def write_comment(self, comment_str):
         """Place a comment in the output stream file."""
         self.lines.append(f"//{comment_str}")
+
+    ############################## Top of stack in D ##############################
+    # With top_of_stack_in_d, pushes load the value into D and leave it
+    # there, and arithmetic takes y from D and leaves the result in D. The
+    # top of the stack is only written to RAM (flushed) when the next push
+    # needs D, and before labels, gotos, calls, returns and functions, so
+    # the stack is all in RAM wherever code can jump to.
+    def flush_top_of_stack(self):
+        """Writes the top of the stack from D to RAM, if it is in D."""
+        if self.top_in_d:
+            self.lines.extend(["@SP",
+                               "M=M+1",
+                               "A=M-1",
+                               "M=D"])
+            self.top_in_d = False
+
+    def _load_top_of_stack(self):
+        """Makes sure the top of the stack is in D (pops it from RAM if not)."""
+        if not self.top_in_d:
+            self.lines.extend(["@SP",
+                               "AM=M-1",
+                               "D=M"])
+            self.top_in_d = True
+
+    def _write_arithmetic_top_in_d(self,command: str):
+        """write_arithmetic with the top of the stack in D: y is in D, x
+        is popped from RAM and the result is left in D."""
+        self.lines.append(f"// write_arithmetic:{command}:")
+        self._load_top_of_stack()
+        match command:
+            case 'neg':
+                self.lines.append('D=-D')
+            case 'not':
+                self.lines.append('D=!D')
+            case _:
+                # x is the top of the stack in RAM:
+                self.lines.extend(["@SP",
+                                   "AM=M-1"])
+                match command:
+                    case 'add':
+                        self.lines.append('D=D+M')
+                    case 'sub':
+                        self.lines.append('D=M-D')
+                    case 'and':
+                        self.lines.append('D=D&M')
+                    case 'or':
+                        self.lines.append('D=D|M')
+                    case ('eq' | 'gt' | 'lt') as comparison:
+                        comparators_dict = {'eq':'JEQ','gt':'JGT','lt':'JLT'}
+                        self.lines.extend(["D=M-D",
+                                           f"@TRUE{str(self.unique)}",
+                                           f"D;{comparators_dict[comparison]}",
+                                           "D=0",
+                                           f"@CONTINUE{str(self.unique)}",
+                                           "0;JMP",
+                                           f"(TRUE{str(self.unique)})",
+                                           "D=-1",
+                                           f"(CONTINUE{str(self.unique)})"])
+                        self.unique += 1
+
+    def _write_push_pop_top_in_d(self,command: str, segment: str, index: int):
+        """write_push_pop with the top of the stack in D."""
+        self.lines.append(f"// write_push_pop:{command} {segment} {index}:")
+        if command == 'push':
+            self.flush_top_of_stack()
+            if segment == 'constant' and index in (0, 1):
+                self.lines.append(f"D={index}")
+            elif segment == 'constant':
+                self.lines.extend([f"@{index}",
+                                   "D=A"])
+            else:
+                self._write_segment_address(segment, index)
+                self.lines.append("D=M")
+            self.top_in_d = True
+        else:
+            self._load_top_of_stack()
+            if segment in ('local', 'argument', 'this', 'that') and index > 1:
+                seg_dict = {'local':'LCL','argument':'ARG','this':'THIS','that':'THAT'}
+                if index <= 8:
+                    # step A up to the address, D keeps the value:
+                    self.lines.extend([f"@{seg_dict[segment]}",
+                                       "A=M+1"])
+                    self.lines.extend(["A=A+1"] * (index - 1))
+                else:
+                    self.lines.extend(["@R14",
+                                       "M=D"])
+                    self._write_segment_address_to_r13(segment, index)
+                    self.lines.extend(["@R14",
+                                       "D=M",
+                                       "@R13",
+                                       "A=M"])
+            else:
+                self._write_segment_address(segment, index)
+            self.lines.append("M=D")
+            self.top_in_d = False
+
+    ############################## Superinstructions ##############################
+    # Runs of VM commands fused by SuperinstructionFuser are written as one
+    # piece of assembly, without going through the stack.
+    def write_superinstruction(self, superinstruction):
+        """Writes assembly for a Superinstruction."""
+        self.flush_top_of_stack() # superinstructions work on the stack in RAM
+        self.lines.append(f"// superinstruction:{superinstruction.name}:")
+        match superinstruction.name:
+            case 'increment':
+                # S i += c, or -= c:
+                segment, index, constant, sign = superinstruction.args
+                if constant == 1:
+                    self._write_segment_address(segment, index)
+                    self.lines.append(f"M=M{sign}1")
+                elif constant != 0:
+                    if segment in ('local', 'argument', 'this', 'that') and index > 1:
+                        # the address doesn't fit in A alone, keep it in R13:
+                        self._write_segment_address_to_r13(segment, index)
+                        self.lines.extend([f"@{constant}",
+                                           "D=A",
+                                           "@R13",
+                                           "A=M"])
+                    else:
+                        self.lines.extend([f"@{constant}",
+                                           "D=A"])
+                        self._write_segment_address(segment, index)
+                    self.lines.append(f"M=M{sign}D")
+            case 'add_constant':
+                # top of stack += c, or -= c:
+                constant, sign = superinstruction.args
+                if constant == 1:
+                    self.lines.extend(["@SP",
+                                       "A=M-1",
+                                       f"M=M{sign}1"])
+                elif constant != 0:
+                    self.lines.extend([f"@{constant}",
+                                       "D=A",
+                                       "@SP",
+                                       "A=M-1",
+                                       f"M=M{sign}D"])
+            case 'copy':
+                # T j = S i, through D:
+                source_segment, source_index, segment, index = superinstruction.args
+                if segment in ('local', 'argument', 'this', 'that') and index > 1:
+                    self._write_segment_address_to_r13(segment, index)
+                    self._write_segment_value(source_segment, source_index)
+                    self.lines.extend(["@R13",
+                                       "A=M",
+                                       "M=D"])
+                else:
+                    self._write_segment_value(source_segment, source_index)
+                    self._write_segment_address(segment, index)
+                    self.lines.append("M=D")
+            case 'push_constant':
+                # push 0, 1 or -1 without loading it into D:
+                value, = superinstruction.args
+                self.lines.extend(["@SP",
+                                   "M=M+1",
+                                   "A=M-1",
+                                   f"M={value}"])
+
+    def _write_segment_address(self, segment, index):
+        """Sets A to the address of segment[index]. D is changed for the
+        local/argument/this/that segments if index > 1."""
+        match segment:
+            case ('local' | 'argument' | 'this' | 'that') as segment:
+                seg_dict = {'local':'LCL','argument':'ARG','this':'THIS','that':'THAT'}
+                if index == 0:
+                    self.lines.extend([f"@{seg_dict[segment]}",
+                                       "A=M"])
+                elif index == 1:
+                    self.lines.extend([f"@{seg_dict[segment]}",
+                                       "A=M+1"])
+                else:
+                    self.lines.extend([f"@{index}",
+                                       "D=A",
+                                       f"@{seg_dict[segment]}",
+                                       "A=D+M"])
+            case ('pointer' | 'temp') as segment:
+                seg_dict = {'pointer':3,'temp':5}
+                self.lines.append(f"@{seg_dict[segment]+index}")
+            case 'static':
+                self.lines.append(f"@{self.current_vm_file_name}.{index}")
+
+    def _write_segment_address_to_r13(self, segment, index):
+        """Stores the address of segment[index] (local/argument/this/that) in R13."""
+        seg_dict = {'local':'LCL','argument':'ARG','this':'THIS','that':'THAT'}
+        self.lines.extend([f"@{seg_dict[segment]}",
+                           "D=M",
+                           f"@{index}",
+                           "D=D+A",
+                           "@R13",
+                           "M=D"])
+
+    def _write_segment_value(self, segment, index):
+        """Sets D to segment[index] (or to index for the constant segment)."""
+        if segment == 'constant':
+            if index in (0, 1):
+                self.lines.append(f"D={index}")
+            else:
+                self.lines.extend([f"@{index}",
+                                   "D=A"])
+        else:
+            self._write_segment_address(segment, index)
+            self.lines.append("D=M")
+
+    ############################## Shared call routines ##############################
+    # With shared_calls, each call site only loads its arguments and jumps
+    # to $$CALL, and each return jumps to $$RETURN. This saves ROM for every
+    # call and return, but runs a few more instructions for each.
+    def _write_shared_call_routines(self):
+        """Writes the $$CALL and $$RETURN routines."""
+        # $$CALL: D = return address, R13 = num_args, R14 = function address
+        self.lines.append("($$CALL)")
+        self._writeDtostack()
+        # push LCL, ARG, THIS, THAT:
+        for item in ["@LCL","@ARG","@THIS","@THAT"]:
+            self.lines.extend([item,"D=M"])
+            self._writeDtostack()
+        # ARG = SP-num_args-5, LCL = SP:
+        self.lines.extend(["@SP",
+                           "D=M",
+                           "@R13",
+                           "D=D-M",
+                           "@5",
+                           "D=D-A",
+                           "@ARG",
+                           "M=D",
+                           "@SP",
+                           "D=M",
+                           "@LCL",
+                           "M=D",
+                           # goto function:
+                           "@R14",
+                           "A=M",
+                           "0;JMP"])
+        self.lines.append("($$RETURN)")
+        self._write_return_frame()
+
+    def shared_calls_report(self) -> list:
+        """Returns lines describing the ROM saved and the instructions added
+        to each call and return by the shared call routines (shared_calls)."""
+        # Measure both ways of writing a call and a return:
+        sizes = {}
+        for shared_calls in [False, True]:
+            writer = VMCodeWriter('', shared_calls = shared_calls)
+            writer.write_call('Function', 0)
+            call_size = count_instructions(writer.lines)
+            writer.lines = []
+            writer.write_return()
+            sizes[shared_calls] = (call_size, count_instructions(writer.lines))
+        (inline_call, inline_return), (site_call, site_return) = sizes[False], sizes[True]
+        writer = VMCodeWriter('')
+        writer._write_shared_call_routines()
+        routines_size = count_instructions(writer.lines)
+        # $$RETURN is the inline return, so $$CALL is the rest:
+        call_routine_size = routines_size - inline_return
+        calls = self.lines.count("@$$CALL")
+        returns = self.lines.count("@$$RETURN")
+        saved = calls*(inline_call - site_call) + returns*(inline_return - site_return) - routines_size
+        return [f'Shared calls: {calls} calls and {returns} returns, {saved} instructions of ROM saved.',
+                f'    each call runs {site_call + call_routine_size - inline_call} more instructions, '
+                f'each return {site_return} more.']
+
+    ############################## Relocatable fragments ##############################
+    # The assembly written for one .vm file can be saved as a fragment
+    # (e.g. in a build cache) and linked into a later program. The
+    # TRUE/CONTINUE and returnaddressfrom labels are numbered by the
+    # unique counters, so they are rebased when the fragment is linked.
+    def fragment_start(self):
+        """Returns a marker of the current position in the output,
+        to be passed to fragment_since."""
+        return (len(self.lines), self.unique, self.uniquefunctionreturn)
+
+    def fragment_since(self, start):
+        """Returns the lines written since start as a fragment dict,
+        with the ranges of the unique counters they used."""
+        line_idx, unique, uniquefunctionreturn = start
+        return {'lines': self.lines[line_idx:],
+                'unique': [unique, self.unique],
+                'return': [uniquefunctionreturn, self.uniquefunctionreturn],
+                'function': self.current_function_name}
+
+    def write_fragment(self, fragment):
+        """Writes a fragment returned by fragment_since, renumbering
+        its unique labels to follow the labels already written."""
+        unique_start, unique_end = fragment['unique']
+        return_start, return_end = fragment['return']
+        unique_offset = self.unique - unique_start
+        if unique_offset == 0 and self.uniquefunctionreturn == return_start:
+            self.lines.extend(fragment['lines'])
+        else:
+            # Return address labels are numbered in the order they
+            # first appear, but end with the called function name, which
+            # may itself end with digits. So strip the known number.
+            return_labels = {}
+            for line in fragment['lines']:
+                if line[:2] in ('@T', '(T', '@C', '(C'):
+                    label = line[1:].rstrip(')')
+                    for prefix in ('TRUE', 'CONTINUE'):
+                        number = label[len(prefix):]
+                        if label.startswith(prefix) and number.isdecimal():
+                            line = line.replace(label, prefix + str(int(number) + unique_offset))
+                elif line[1:19] == 'returnaddressfrom.':
+                    label = line[1:].rstrip(')')
+                    if label not in return_labels:
+                        old_number = str(return_start + len(return_labels))
+                        new_number = str(self.uniquefunctionreturn + len(return_labels))
+                        return_labels[label] = label[:-len(old_number)] + new_number
+                    line = line.replace(label, return_labels[label])
+                self.lines.append(line)
+        self.unique += unique_end - unique_start
+        self.uniquefunctionreturn += return_end - return_start
+        self.current_function_name = fragment['function']
+
+def count_instructions(lines) -> int:
+    """Returns the number of instructions (not labels or comments) in lines."""
+    count = 0
+    for line in lines:
+        instruction = line.split('//')[0].strip()
+        if instruction and instruction[0] != '(':
+            count += 1
+    return count
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3.10
+
+# Runs a .vm file or folder of .vm files directly, without translating
+# it to assembly, and prints the number of VM commands run, the speed
+# and a range of RAM. Used to test compiled programs quickly and as a
+# reference for the output of the translator.
+# Tested on python 3.10.0
+
+# Hack memory map:
+RAM_SIZE = 32768
+SCREEN = 16384
+KEYBOARD = 24576
+STACK_BASE = 256
+FIRST_VARIABLE = 16 # first address given to static variables by the assembler
+
+# Opcodes of the pre-parsed commands. Each command is a tuple
+# (opcode, x, y), x and y depend on the opcode:
+PUSH_CONSTANT = 0 # x = value
+PUSH_SEGMENT = 1 # x = segment pointer address (LCL..THAT), y = index
+PUSH_ADDRESS = 2 # x = address (static, temp and pointer)
+POP_SEGMENT = 3 # x = segment pointer address, y = index
+POP_ADDRESS = 4 # x = address
+ADD = 5
+SUB = 6
+NEG = 7
+EQ = 8
+GT = 9
+LT = 10
+AND = 11
+OR = 12
+NOT = 13
+GOTO = 14 # x = command index
+IF_GOTO = 15 # x = command index
+CALL = 16 # x = command index of the function, y = number of arguments
+FUNCTION = 17 # x = number of locals
+RETURN = 18
+HALT = 19 # a goto to itself, or the end of the program
+
+ARITHMETIC_OPCODES = {'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT, 'lt': LT,
+                      'and': AND, 'or': OR, 'not': NOT}
+SEGMENT_POINTERS = {'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+SEGMENT_ADDRESSES = {'pointer': 3, 'temp': 5}
+
+class VMInterpreter:
+    """Runs a VM program the way the translated program runs on the Hack
+    computer: the stack, the segments and the call frames are kept in an
+    emulated RAM, with the same memory map. Commands are parsed once into
+    a list of (opcode, x, y) tuples, with labels and function names
+    resolved to command indices, and labels removed. The tuples are
+    unpacked in one step by the dispatch loop. A flat array('l') of
+    opcode, x, y words is smaller, but reading three words per command
+    makes the loop about 40% slower.
+    Static variables get the RAM addresses the assembler would give them.
+    Return addresses are command indices instead of ROM addresses, so
+    only the return addresses on the stack differ from the Hack program.
+    RAM holds unsigned 16-bit values."""
+
+    def __init__(self, vm_files):
+        """Loads a program from vm_files, a list of (vm file name, vm line
+        list), e.g. from load_vm_files. The program starts with a call to
+        Sys.init, like the translated program, or with its first command
+        if it has no Sys.init."""
+        from vmparser import VMParser
+        import os
+        self.code = []
+        self.commands = [] # (function, VM command) of each entry of self.code
+        self.static_addresses = {}
+        function_indices = {}
+        label_indices = {}
+        jumps = [] # (code index, label or function name) to resolve
+        next_variable = FIRST_VARIABLE
+        frame_variables = False
+        function_name = ''
+        for vm_file_name, lines in vm_files:
+            static_prefix = os.path.basename(vm_file_name)[:-3]
+            parser = VMParser(vm_file_name, lines = lines)
+            for vm_command in parser:
+                command = vm_command.text
+                match vm_command.command_type:
+                    case 'C_ARITHMETIC':
+                        instruction = (ARITHMETIC_OPCODES[vm_command.arg1], 0, 0)
+                    case ('C_PUSH' | 'C_POP') as ctype:
+                        segment, index = vm_command.arg1, vm_command.arg2
+                        push = ctype == 'C_PUSH'
+                        if segment == 'constant' and push:
+                            instruction = (PUSH_CONSTANT, index, 0)
+                        elif segment in SEGMENT_POINTERS:
+                            instruction = (PUSH_SEGMENT if push else POP_SEGMENT, SEGMENT_POINTERS[segment], index)
+                        else:
+                            if segment in SEGMENT_ADDRESSES:
+                                address = SEGMENT_ADDRESSES[segment] + index
+                            elif segment == 'static':
+                                # variables are numbered in order of first use:
+                                name = f'{static_prefix}.{index}'
+                                if name not in self.static_addresses:
+                                    self.static_addresses[name] = next_variable
+                                    next_variable += 1
+                                address = self.static_addresses[name]
+                            else:
+                                raise ValueError(f'Unknown segment in {vm_file_name}: {command}')
+                            instruction = (PUSH_ADDRESS if push else POP_ADDRESS, address, 0)
+                    case 'C_LABEL':
+                        label_indices[f'{function_name}${vm_command.arg1}'] = len(self.code)
+                        instruction = None
+                    case ('C_GOTO' | 'C_IF') as ctype:
+                        jumps.append((len(self.code), f'{function_name}${vm_command.arg1}'))
+                        instruction = (GOTO if ctype == 'C_GOTO' else IF_GOTO, 0, 0)
+                    case 'C_FUNCTION':
+                        function_name = vm_command.arg1
+                        function_indices[function_name] = len(self.code)
+                        instruction = (FUNCTION, vm_command.arg2, 0)
+                    case 'C_RETURN':
+                        if not frame_variables:
+                            # the translated return uses the FRAME and RET variables:
+                            frame_variables = True
+                            next_variable += 2
+                        instruction = (RETURN, 0, 0)
+                    case 'C_CALL':
+                        jumps.append((len(self.code), vm_command.arg1))
+                        instruction = (CALL, 0, vm_command.arg2)
+                if instruction is not None:
+                    self.code.append(instruction)
+                    self.commands.append((function_name, command))
+        # Resolve jumps and calls to command indices:
+        for code_index, target in jumps:
+            opcode, x, y = self.code[code_index]
+            if opcode == CALL:
+                if target not in function_indices:
+                    raise ValueError(f'{self.commands[code_index][0]} calls undefined function {target}')
+                self.code[code_index] = (CALL, function_indices[target], y)
+            elif target not in label_indices:
+                raise ValueError(f'Undefined label {target} in {self.commands[code_index][1]}')
+            elif opcode == GOTO and label_indices[target] == code_index:
+                # a loop that does nothing (label X, goto X) is a halt:
+                self.code[code_index] = (HALT, 0, 0)
+            else:
+                self.code[code_index] = (opcode, label_indices[target], 0)
+        # running past the end of the program halts:
+        self.code.append((HALT, 0, 0))
+        self.commands.append(('', ''))
+        self.ram = [0] * RAM_SIZE
+        self.reset()
+        if 'Sys.init' in function_indices:
+            # Bootstrap as the translator does: SP = 256, call Sys.init 0.
+            # Its return address is the end of the program.
+            self.ram[STACK_BASE] = len(self.code) - 1
+            self.ram[0] = STACK_BASE + 5
+            self.ram[2] = STACK_BASE
+            self.ram[1] = STACK_BASE + 5
+            self.pc = function_indices['Sys.init']
+        else:
+            self.ram[0] = STACK_BASE
+
+    def reset(self):
+        """Sets the command index and the step count to 0 (RAM is kept)."""
+        self.pc = 0
+        self.steps = 0
+        self.halted = False
+
+    def run(self, max_steps) -> int:
+        """Runs until max_steps VM commands have been run in total, or until
+        the program halts (runs a goto to itself or past its last command).
+        Returns the number of commands run."""
+        code, ram = self.code, self.ram
+        pc, steps, sp = self.pc, self.steps, ram[0]
+        started = steps
+        try:
+            while steps < max_steps:
+                opcode, x, y = code[pc]
+                pc += 1
+                steps += 1
+                # most frequent opcodes first:
+                if opcode == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[x] + y]
+                    sp += 1
+                elif opcode == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[x] + y] = ram[sp]
+                elif opcode == ADD:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] + ram[sp]) & 65535
+                elif opcode == PUSH_CONSTANT:
+                    ram[sp] = x
+                    sp += 1
+                elif opcode == NOT:
+                    ram[sp - 1] ^= 65535
+                elif opcode == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = x
+                elif opcode == LT:
+                    sp -= 1
+                    ram[sp - 1] = 65535 if (ram[sp - 1] - ram[sp]) & 65535 >= 32768 else 0
+                elif opcode == GOTO:
+                    pc = x
+                elif opcode == NEG:
+                    ram[sp - 1] = -ram[sp - 1] & 65535
+                elif opcode == PUSH_ADDRESS:
+                    ram[sp] = ram[x]
+                    sp += 1
+                elif opcode == POP_ADDRESS:
+                    sp -= 1
+                    ram[x] = ram[sp]
+                elif opcode == CALL:
+                    # push the return address and the caller's LCL, ARG, THIS, THAT:
+                    ram[sp] = pc
+                    ram[sp + 1:sp + 5] = ram[1:5]
+                    sp += 5
+                    ram[2] = sp - y - 5 # ARG
+                    ram[1] = sp # LCL
+                    pc = x
+                elif opcode == FUNCTION:
+                    ram[sp:sp + x] = [0] * x
+                    sp += x
+                elif opcode == RETURN:
+                    frame = ram[1]
+                    pc = ram[frame - 5]
+                    argument = ram[2]
+                    ram[argument] = ram[sp - 1]
+                    sp = argument + 1
+                    ram[1:5] = ram[frame - 4:frame]
+                elif opcode == SUB:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] - ram[sp]) & 65535
+                elif opcode == EQ:
+                    sp -= 1
+                    ram[sp - 1] = 65535 if ram[sp - 1] == ram[sp] else 0
+                elif opcode == GT:
+                    # like the translation, compares the sign of x - y:
+                    sp -= 1
+                    ram[sp - 1] = 65535 if 0 < (ram[sp - 1] - ram[sp]) & 65535 < 32768 else 0
+                elif opcode == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif opcode == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                else: # HALT
+                    pc -= 1
+                    steps -= 1
+                    self.halted = True
+                    break
+        except IndexError:
+            function, command = self.commands[pc - 1]
+            raise RuntimeError(f'Address out of RAM at {function}: {command} (SP = {sp})') from None
+        self.pc, self.steps, ram[0] = pc, steps, sp
+        return steps - started
+
+    def peek(self, address) -> int:
+        """Returns RAM[address] as a signed 16-bit int."""
+        value = self.ram[address]
+        if value >= 32768:
+            return value - 65536
+        return value
+
+    def press_key(self, key):
+        """Sets the keyboard register to key (a character code, 0 for no key)."""
+        self.ram[KEYBOARD] = key
+
+    def screen_lines(self) -> list:
+        """Returns the screen as 256 rows of 512 characters, '#' for a
+        black pixel. Trailing blank rows are left out."""
+        rows = []
+        for row in range(256):
+            words = self.ram[SCREEN + 32*row:SCREEN + 32*row + 32]
+            # the lowest bit of each word is its leftmost pixel:
+            rows.append(''.join(format(word, '016b')[::-1] for word in words)
+                        .replace('0', ' ').replace('1', '#').rstrip())
+        while rows and rows[-1] == '':
+            rows.pop()
+        return rows
+
+def load_vm_files(filename, vm_sources=None) -> list:
+    """Returns a list of (vm file name, vm line list) for a .vm file or
+    a folder of .vm files. vm_sources is an optional list of the same,
+    e.g. from jack_analyzer_main, that replace the files of the same
+    name (as in VMtranslator_main)."""
+    import os
+    if os.path.isdir(filename):
+        vmfilelist = []
+        for (dirpath, dirnames, insidefilenames) in os.walk(filename):
+            vmfilelist.extend(os.path.join(dirpath, insidefilename) for insidefilename in insidefilenames)
+    else:
+        vmfilelist = [filename]
+    vmfilelist = [vfile for vfile in vmfilelist if vfile[-3:] == '.vm']
+    if vm_sources is None:
+        vm_sources = []
+    memory_sources = {os.path.normpath(name): lines for (name, lines) in vm_sources}
+    on_disk = {os.path.normpath(vfile) for vfile in vmfilelist}
+    vmfilelist.extend(name for (name, lines) in vm_sources if os.path.normpath(name) not in on_disk)
+    vm_files = []
+    for vmfile in vmfilelist:
+        lines = memory_sources.get(os.path.normpath(vmfile))
+        if lines is None:
+            with open(vmfile, 'r') as file:
+                lines = file.read().splitlines()
+        vm_files.append((vmfile, lines))
+    return vm_files
+
+def vm_interpreter_main(filename, max_steps, vm_sources=None, dump_range=None, key=0, show_screen=False):
+    """Runs a .vm file or folder of .vm files (and vm_sources, see
+    load_vm_files) for up to max_steps VM commands and prints the commands
+    run, the speed and the RAM words in dump_range ((first, last)
+    addresses, inclusive). key is held down on the keyboard. If
+    show_screen is True, the screen is printed."""
+    import time
+    interpreter = VMInterpreter(load_vm_files(filename, vm_sources))
+    interpreter.press_key(key)
+    start_time = time.perf_counter()
+    steps = interpreter.run(max_steps)
+    run_time = time.perf_counter() - start_time
+    state = 'halted' if interpreter.halted else 'stopped'
+    print(f'{state} after {steps} VM commands in {run_time:.2f}s '
+          f'({steps / max(run_time, 1e-9) / 1e6:.1f}M commands/s)')
+    if dump_range is not None:
+        first, last = dump_range
+        print(f'RAM[{first}..{last}]: {[interpreter.peek(address) for address in range(first, last + 1)]}')
+    if show_screen:
+        print('\n'.join(interpreter.screen_lines()))
+    return interpreter
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Run .vm files without translating them.')
+    argparser.add_argument('filename', help = '.vm file or folder of .vm files')
+    argparser.add_argument('--steps', type = int, default = 10_000_000,
+                           help = 'maximum number of VM commands to run')
+    argparser.add_argument('--dump', metavar = 'FIRST:LAST',
+                           help = 'print RAM[FIRST..LAST] after running')
+    argparser.add_argument('--key', type = int, default = 0,
+                           help = 'character code of the key held down on the keyboard')
+    argparser.add_argument('--screen', action = 'store_true',
+                           help = 'print the screen after running')
+    args = argparser.parse_args()
+    dump_range = None
+    if args.dump is not None:
+        first, last = args.dump.split(':')
+        dump_range = (int(first), int(last))
+    vm_interpreter_main(args.filename, args.steps, dump_range = dump_range, key = args.key,
+                        show_screen = args.screen)
@@ -1,87 +1,86 @@
 ### Contains the VM parser module for the assembler for the Hack Computer TECS ###
 
+# Command type of each VM command (first word of the line):
+COMMAND_TYPES = {'add':'C_ARITHMETIC',
+                 'sub':'C_ARITHMETIC',
+                 'neg':'C_ARITHMETIC',
+                 'eq':'C_ARITHMETIC',
+                 'gt':'C_ARITHMETIC',
+                 'lt':'C_ARITHMETIC',
+                 'and':'C_ARITHMETIC',
+                 'or':'C_ARITHMETIC',
+                 'not':'C_ARITHMETIC',
+                 'push':'C_PUSH',
+                 'pop':'C_POP',
+                 'label':'C_LABEL',
+                 'goto':'C_GOTO',
+                 'if-goto':'C_IF',
+                 'function':'C_FUNCTION',
+                 'return':'C_RETURN',
+                 'call':'C_CALL',
+    }
+
+# Number of arguments after the first word of each command type:
+ARGUMENT_COUNTS = {'C_ARITHMETIC':0, 'C_PUSH':2, 'C_POP':2, 'C_LABEL':1, 'C_GOTO':1,
+                   'C_IF':1, 'C_FUNCTION':2, 'C_RETURN':0, 'C_CALL':2}
+
+class VMCommand():
+    """One VM command, split up once by VMParser. command_type is one of
+    the COMMAND_TYPES values. arg1 is the operation of arithmetic
+    commands ('add', ...), the segment of push/pop, or the label or
+    function name. arg2 is the index of push/pop, the number of locals of
+    function or the number of arguments of call (an int), else None.
+    text is the line without its comment."""
+    __slots__ = ('command_type', 'arg1', 'arg2', 'text')
+
+    def __init__(self, command_type, arg1, arg2, text):
+        self.command_type = command_type
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.text = text
+
+    def __repr__(self):
+        return f'VMCommand({self.command_type}, {self.text!r})'
+
 class VMParser():
-    # takes a .vm file name when initialized. returns object with attributes
-    # relating to current command and can be stepped through the vm file.
-    def __init__(self,input_file_name):
-        # from symbol_table import AssemblerSymbolTable
-        self.lines = []
-        with open(input_file_name, 'r') as file:
-            for line in file:
-                if '//' in line:
-                    comment_index = line.find('//')
-                    stripped_line = line[:comment_index].strip()
-                else:
-                    stripped_line = line.strip()
-                if len(stripped_line) > 0:
-                    self.lines.append(stripped_line)
+    """Takes a .vm file name when initialized. Reads the file in one pass
+    and splits each line into a VMCommand. Iterating over the parser
+    gives the commands in order.
+    If lines is given, it is used as the file contents instead of
+    reading input_file_name from disk."""
+
+    def __init__(self,input_file_name,lines=None):
+        if lines is None:
+            with open(input_file_name, 'r') as file:
+                lines = file.read().splitlines()
+        self.commands = []
+        for line in lines:
+            if '//' in line:
+                line = line[:line.find('//')]
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            words = line.split()
+            command_type = COMMAND_TYPES.get(words[0])
+            if command_type is None:
+                raise ValueError(f'Unknown VM command in {input_file_name}: {line}')
+            if len(words) != ARGUMENT_COUNTS[command_type] + 1:
+                raise ValueError(f'Wrong number of arguments in {input_file_name}: {line}')
+            match len(words):
+                case 1:
+                    arg1 = words[0] if command_type == 'C_ARITHMETIC' else None
+                    arg2 = None
+                case 2:
+                    arg1, arg2 = words[1], None
+                case 3:
+                    arg1, arg2 = words[1], int(words[2])
+            self.commands.append(VMCommand(command_type, arg1, arg2, line))
         #check for empty file:
-        if len(self.lines) < 1:
+        if len(self.commands) < 1:
             raise ValueError('VM file is empty')
 
-        # Initialize a symbol table and do first pass of assembly to:
-        # 1. add labels to symbol table
-        # 2. remove labels from list of instructions
-        # self.sym_table = AssemblerSymbolTable(assembler_map_init = True)
-        # counter = 0
-        # newlines = []
-        # for line in self.lines:
-        #     if line[0] == '(':
-        #         #add label to symbol table and remove line
-        #         self.sym_table.add_entry(line[1:-1],counter)
-        #     else:
-        #         newlines.append(line)
-        #         counter += 1
-        # self.lines = newlines
-        
-        # Attributes:
-        self.current_index = 0
-        self.current_command = self.lines[self.current_index]
-        self.max_index = len(self.lines) - 1
-         
-    def has_more_commands(self):
-        if self.current_index < self.max_index:
-            return True
-        else:
-            return False
-
-    def advance(self):
-        """Advances to next command in list."""
-        self.current_index += 1
-        if self.current_index > self.max_index:
-            raise ValueError('Tried to force vmparser advance beyond last command in file.')
-        self.current_command = self.lines[self.current_index]
-        
-    def command_type(self) -> str:
-        """Returns command type of current command. First word of line is used."""
-        command_type = {'add':'C_ARITHMETIC',
-                            'sub':'C_ARITHMETIC',
-                            'neg':'C_ARITHMETIC',
-                            'eq':'C_ARITHMETIC',
-                            'gt':'C_ARITHMETIC',
-                            'lt':'C_ARITHMETIC',
-                            'and':'C_ARITHMETIC',
-                            'or':'C_ARITHMETIC',
-                            'not':'C_ARITHMETIC',
-                            'push':'C_PUSH',
-                            'pop':'C_POP',
-                            'label':'C_LABEL',
-                            'goto':'C_GOTO',
-                            'if-goto':'C_IF',
-                            'function':'C_FUNCTION',
-                            'return':'C_RETURN',
-                            'call':'C_CALL',
-            }
-        command = self.current_command.split(' ')[0]
-        return command_type[command]
-
-    def arg1(self) -> str:
-        if self.command_type() == 'C_ARITHMETIC':
-            command = self.current_command.split(' ')[0]
-        else:
-            command = self.current_command.split(' ')[1]
-        return command
+    def __iter__(self):
+        return iter(self.commands)
 
-    def arg2(self) -> int:
-        arg2 = self.current_command.split(' ')[2]
-        return int(arg2)
\ No newline at end of file
+    def __len__(self):
+        return len(self.commands)
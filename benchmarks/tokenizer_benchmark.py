@@ -0,0 +1,149 @@
+#!/usr/bin/env python3.10
+
+# Benchmarks JackTokenizer on a large generated Jack source.
+# The source is made by repeating the given .jack files (or a built-in
+# sample class) until it reaches the requested size. The single-pass
+# regex tokenizer is compared with the line by line, character by
+# character tokenizer it replaced, which is kept below as a reference.
+# Both must produce the same (token_type, token) stream.
+# Usage: ./tokenizer_benchmark.py [--size KB] [file.jack ...]
+
+SAMPLE_CLASS = '''
+/** Sample class used to generate benchmark input.
+ *  Has every kind of token and comment. */
+class Sample {
+    field int x, y; // position
+    static boolean done;
+
+    constructor Sample new(int ax, int ay) {
+        let x = ax; /* inline comment */ let y = ay;
+        return this;
+    }
+
+    method int update(Array values, int count) {
+        var int i, total;
+        let i = 0;
+        while ((i < count) & ~done) {
+            let total = total + (values[i] * 3) - (x / 2);
+            if (total > 1000) { let done = true; } else { let y = y | 1; }
+            let i = i + 1;
+        }
+        do Output.printString("total: ");
+        return total;
+    }
+}
+'''
+
+def legacy_tokenize(source):
+    """The original JackTokenizer algorithm: strip comments line by
+    line, then walk each line one character at a time."""
+    lines = []
+    in_multiline_comment = False
+    for line in source.splitlines():
+        stripped_line = ''
+        if in_multiline_comment:
+            if '*/' in line:
+                in_multiline_comment = False
+                stripped_line = line[line.index('*/') + 2:].strip()
+        elif '/*' in line:
+            begin_open_comment_idx = line.index('/*')
+            stripped_line = line[:begin_open_comment_idx].strip()
+            in_multiline_comment = True
+            if '*/' in line[begin_open_comment_idx + 2:]:
+                in_multiline_comment = False
+                stripped_line = (stripped_line + line[line.index('*/', begin_open_comment_idx + 2) + 2:]).strip()
+        elif '//' in line:
+            stripped_line = line[:line.find('//')].strip()
+        else:
+            stripped_line = line.strip()
+        if len(stripped_line) > 0:
+            lines.append(stripped_line)
+
+    def tokenize_word(word):
+        word = ''.join(word)
+        keywords = {'class', 'constructor', 'function', 'method', 'field', 'static',
+                    'var', 'int', 'char', 'boolean', 'void', 'true', 'false',
+                    'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return'}
+        if word in keywords:
+            return ('keyword', word)
+        elif word.isnumeric():
+            return ('integerConstant', int(word))
+        return ('identifier', word)
+
+    tokens_list = []
+    for line in lines:
+        char_list = [char for char in line]
+        idx = 0
+        current_word = []
+        while idx < len(char_list):
+            char = char_list[idx]
+            match char:
+                case '"':
+                    if current_word:
+                        tokens_list.append(tokenize_word(current_word))
+                        current_word = []
+                    closing_idx = char_list.index('"', idx + 1)
+                    tokens_list.append(('stringConstant', ''.join(char_list[idx + 1:closing_idx])))
+                    idx = closing_idx
+                case ('{'|'}'|'('|')'|'['|']'|'.'|','|';'|'+'|'-'|'*'|'/'|'&'|'|'|'<'|'>'|'='|'~'):
+                    if current_word:
+                        tokens_list.append(tokenize_word(current_word))
+                        current_word = []
+                    symbol = {'<':'&lt;', '>':'&gt;', '&':'&amp;'}.get(char, char)
+                    tokens_list.append(('symbol', symbol))
+                case ' ':
+                    if current_word:
+                        tokens_list.append(tokenize_word(current_word))
+                        current_word = []
+                case _:
+                    current_word.append(char)
+            idx += 1
+        if current_word:
+            tokens_list.append(tokenize_word(current_word))
+    return tokens_list
+
+def tokenizer_benchmark_main(jack_files, size_kb, repeats=3):
+    import os
+    import sys
+    import tempfile
+    import time
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CompilationEngine'))
+    from jacktokenizer import JackTokenizer
+
+    # Build the benchmark source:
+    sample = ''
+    for jack_file in jack_files:
+        with open(jack_file, 'r') as file:
+            sample += file.read() + '\n'
+    if not sample:
+        sample = SAMPLE_CLASS
+    source = sample * max(1, (size_kb * 1024) // len(sample))
+    with tempfile.NamedTemporaryFile('w', suffix = '.jack', delete = False) as source_file:
+        source_file.write(source)
+    try:
+        legacy_time = new_time = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            legacy_tokens = legacy_tokenize(source)
+            legacy_time = min(legacy_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            tokenizer = JackTokenizer(source_file.name)
+            new_time = min(new_time, time.perf_counter() - start)
+    finally:
+        os.remove(source_file.name)
+    new_tokens = tokenizer.tokens_list
+    if legacy_tokens != new_tokens:
+        raise ValueError('Tokenizers produced different token streams.')
+
+    print(f"Source: {len(source) // 1024} KB, {len(new_tokens)} tokens")
+    print(f"Legacy tokenizer: {legacy_time:.3f} s ({len(legacy_tokens) / legacy_time:,.0f} tokens/s)")
+    print(f"Regex tokenizer:  {new_time:.3f} s ({len(new_tokens) / new_time:,.0f} tokens/s)")
+    print(f"Speedup: {legacy_time / new_time:.1f}x")
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description = 'Benchmark the Jack tokenizer.')
+    argparser.add_argument('jack_files', nargs = '*', help = '.jack files used as benchmark input')
+    argparser.add_argument('--size', type = int, default = 2048, help = 'size of generated source in KB')
+    args = argparser.parse_args()
+    tokenizer_benchmark_main(args.jack_files, args.size)
@@ -0,0 +1,73 @@
+# Implements the persistent build cache used by JackCompiler.py.
+# Entries are stored as .json files in a cache directory (e.g.
+# Folder/.tecs-cache/) and keyed by a hash of the source they were
+# built from, the toolchain source code and the build options, so
+# changing the compiler or the options never reuses stale entries.
+
+class BuildCache:
+    """Stores build results (vm code of a class, assembly fragment of a
+    .vm file) keyed by the content they were built from."""
+    def __init__(self, cache_dir, options=''):
+        """Opens (or creates) the cache in cache_dir. options is a string
+        describing any build settings that change the generated code."""
+        import hashlib
+        import os
+        self.cache_dir = cache_dir
+        self.used = set()
+        # Hash the toolchain itself, so cached output is dropped
+        # whenever the compiler or VM translator changes:
+        toolchain_hash = hashlib.sha256(options.encode())
+        toolchain_dir = os.path.dirname(os.path.abspath(__file__))
+        for folder in ['CompilationEngine', 'VMtranslator']:
+            folder_path = os.path.join(toolchain_dir, folder)
+            for source_name in sorted(os.listdir(folder_path)):
+                if source_name[-3:] == '.py':
+                    with open(os.path.join(folder_path, source_name), 'rb') as source_file:
+                        toolchain_hash.update(source_file.read())
+        self.version = toolchain_hash.hexdigest()
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def get(self, kind, source):
+        """Returns the value stored for source (a string) of kind
+        ('jack' or 'vm'), or None if it isn't in the cache."""
+        import json
+        key = self.__entry_key__(kind, source)
+        try:
+            with open(self.__entry_path__(key), 'r') as entry_file:
+                value = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        self.used.add(key)
+        return value
+
+    def put(self, kind, source, value):
+        """Stores value (any json serializable object) for source of kind."""
+        import json
+        import os
+        key = self.__entry_key__(kind, source)
+        # Write to a temporary file first so an interrupted build
+        # can't leave a truncated entry behind:
+        temp_path = self.__entry_path__(key) + '.tmp'
+        with open(temp_path, 'w') as entry_file:
+            json.dump(value, entry_file)
+        os.replace(temp_path, self.__entry_path__(key))
+        self.used.add(key)
+
+    def prune(self):
+        """Removes entries that weren't used since the cache was opened,
+        so the cache only holds the output of the latest build."""
+        import os
+        for entry_name in os.listdir(self.cache_dir):
+            if entry_name[-5:] == '.json' and entry_name[:-5] not in self.used:
+                os.remove(os.path.join(self.cache_dir, entry_name))
+
+    def __entry_key__(self, kind, source):
+        import hashlib
+        key_hash = hashlib.sha256(self.version.encode())
+        key_hash.update(kind.encode())
+        key_hash.update(source.encode())
+        return key_hash.hexdigest()
+
+    def __entry_path__(self, key):
+        import os
+        return os.path.join(self.cache_dir, key + '.json')
@@ -0,0 +1,73 @@
+# Shared helpers for the tests: build the Jack programs in tests/programs
+# with the toolchain's options and run them on the emulator.
+# The stages import their modules by bare name, like JackCompiler.py
+# does, so the stage folders are put on sys.path first.
+
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAMS_DIR = os.path.join(REPO_DIR, 'tests', 'programs')
+for stage in ['Emulator', 'Assembler', 'VMtranslator', 'CompilationEngine']:
+    sys.path.insert(0, os.path.join(REPO_DIR, stage))
+sys.path.append(REPO_DIR)
+
+# The programs write their results to RAM[OUTPUT..] and the test OS's
+# Sys.init sets RAM[DONE] to 1 when Main.main returns:
+OUTPUT = 8000
+OUTPUT_WORDS = 16
+DONE = 7999
+MAX_STEPS = 20_000_000
+
+def copy_program(program, folder, with_os=True):
+    """Copies the .jack files of tests/programs/program (and of the test
+    OS if with_os is True) into folder, which is returned."""
+    os.makedirs(folder, exist_ok=True)
+    sources = [program, 'os'] if with_os else [program]
+    for source in sources:
+        source_dir = os.path.join(PROGRAMS_DIR, source)
+        for file_name in os.listdir(source_dir):
+            if file_name.endswith('.jack'):
+                shutil.copy(os.path.join(source_dir, file_name), folder)
+    return str(folder)
+
+def build(folder, jack_options=None, vm_options=None, cache=None):
+    """Compiles the .jack files in folder to machine code (an array of
+    words) with jack_analyzer_main, VMtranslator_main and assembler_main,
+    in memory. jack_options and vm_options are keyword arguments of the
+    first two stages."""
+    from jackanalyzer import jack_analyzer_main
+    from VMtranslator import VMtranslator_main
+    from assembler import assembler_main
+    vm_sources = jack_analyzer_main(folder, write_vm = False, cache = cache, **(jack_options or {}))
+    asm_lines = VMtranslator_main(folder, vm_sources = vm_sources, write_asm = False, cache = cache,
+                                  **(vm_options or {}))
+    return assembler_main(folder + '.asm', asm_lines = asm_lines)
+
+def run(machine, max_steps=MAX_STEPS):
+    """Runs an emulator or VMInterpreter in chunks until the program sets
+    RAM[DONE], and returns RAM[OUTPUT..OUTPUT+OUTPUT_WORDS-1]."""
+    while machine.peek(DONE) != 1:
+        assert machine.steps < max_steps, 'program did not finish'
+        machine.run(machine.steps + 100_000)
+    return [machine.peek(address) for address in range(OUTPUT, OUTPUT + OUTPUT_WORDS)]
+
+def run_machine_code(machine_code):
+    """Runs machine code on the emulator, see run."""
+    from hackemulator import HackEmulator
+    return run(HackEmulator(machine_code))
+
+@pytest.fixture(scope = 'session')
+def baseline(tmp_path_factory):
+    """Returns a function giving the output of a program built with no
+    options, built once per test session."""
+    outputs = {}
+    def baseline_output(program):
+        if program not in outputs:
+            folder = copy_program(program, tmp_path_factory.mktemp('baseline') / program)
+            outputs[program] = run_machine_code(build(folder))
+        return outputs[program]
+    return baseline_output
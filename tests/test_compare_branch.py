@@ -0,0 +1,70 @@
+# Checks that comparisons followed by if-goto give the same results when
+# they are fused into one jump (compare_branch) as when they aren't, for
+# eq, gt and lt, with and without a not, and operands near +-32767 where
+# x - y overflows.
+
+import pytest
+
+from conftest import DONE, OUTPUT
+
+OPERANDS = [-32768, -32767, -32766, -1, 0, 1, 32766, 32767]
+
+def push_constant(value):
+    """VM commands pushing any 16-bit value (constants only go up to 32767)."""
+    if value == -32768:
+        return ['push constant 32767', 'neg', 'push constant 1', 'sub']
+    if value < 0:
+        return [f'push constant {-value}', 'neg']
+    return [f'push constant {value}']
+
+def comparison_program(comparison, negated):
+    """Sys.init writes 1 to RAM[OUTPUT + n] if the test of the nth pair of
+    operands jumps, else 0."""
+    lines = ['function Sys.init 0', f'push constant {OUTPUT}', 'pop pointer 1']
+    case = 0
+    for x in OPERANDS:
+        for y in OPERANDS:
+            lines.extend(push_constant(x) + push_constant(y) + [comparison])
+            if negated:
+                lines.append('not')
+            lines.extend([f'if-goto TAKEN{case}', 'push constant 0', f'pop that {case}', f'goto NEXT{case}',
+                          f'label TAKEN{case}', 'push constant 1', f'pop that {case}', f'label NEXT{case}'])
+            case += 1
+    lines.extend([f'push constant {DONE}', 'pop pointer 1', 'push constant 1', 'pop that 0',
+                  'label END', 'goto END'])
+    return lines
+
+def run_comparisons(folder, comparison, negated, **vm_options):
+    from VMtranslator import VMtranslator_main
+    from assembler import assembler_main
+    from hackemulator import HackEmulator
+    folder.mkdir(exist_ok = True)
+    vm_sources = [(str(folder / 'Sys.vm'), comparison_program(comparison, negated))]
+    asm_lines = VMtranslator_main(str(folder), vm_sources = vm_sources, write_asm = False, **vm_options)
+    emulator = HackEmulator(assembler_main(str(folder) + '.asm', asm_lines = asm_lines))
+    emulator.run(1_000_000)
+    assert emulator.peek(DONE) == 1
+    return [emulator.peek(OUTPUT + case) for case in range(len(OPERANDS) ** 2)]
+
+@pytest.mark.parametrize('top_of_stack_in_d', [False, True])
+@pytest.mark.parametrize('comparison', ['eq', 'gt', 'lt'])
+def test_fused_same_as_unfused(comparison, top_of_stack_in_d, tmp_path):
+    results = {}
+    for negated in (False, True):
+        unfused = run_comparisons(tmp_path / f'unfused{negated}', comparison, negated,
+                                  top_of_stack_in_d = top_of_stack_in_d)
+        fused = run_comparisons(tmp_path / f'fused{negated}', comparison, negated,
+                                top_of_stack_in_d = top_of_stack_in_d, compare_branch = True)
+        assert fused == unfused
+        results[negated] = fused
+    # a not inverts every jump, and eq doesn't overflow:
+    assert results[True] == [1 - taken for taken in results[False]]
+    if comparison == 'eq':
+        assert results[False] == [int(x == y) for x in OPERANDS for y in OPERANDS]
+
+def test_fused_jumps(tmp_path):
+    from VMtranslator import VMtranslator_main
+    vm_sources = [(str(tmp_path / 'Sys.vm'), comparison_program('lt', True))]
+    asm_lines = VMtranslator_main(str(tmp_path), vm_sources = vm_sources, write_asm = False, compare_branch = True)
+    # no true/false is built on the stack:
+    assert not any(line.startswith('(TRUE') for line in asm_lines)
@@ -0,0 +1,43 @@
+# Runs small assembly programs on the emulator.
+
+# Adds RAM[0] and RAM[1] into RAM[2], counting down in a loop:
+ADD_LOOP = ['@100', 'D=A', '@0', 'M=D', '@23', 'D=A', '@1', 'M=D', '@2', 'M=0',
+            '(LOOP)', '@0', 'D=M', '@END', 'D;JEQ', '@0', 'M=M-1', '@2', 'M=M+1', '@LOOP', '0;JMP',
+            '(END)', '@1', 'D=M', '@2', 'M=D+M', '(HALT)', '@HALT', '0;JMP']
+
+def assemble(folder, asm_lines, rom_image=False):
+    from assembler import assembler_main
+    return assembler_main(str(folder / 'Test.asm'), asm_lines = asm_lines, rom_image = rom_image)
+
+def test_add_loop(tmp_path):
+    from hackemulator import HackEmulator
+    emulator = HackEmulator(assemble(tmp_path, ADD_LOOP))
+    emulator.run(100_000)
+    assert emulator.halted
+    assert emulator.peek(2) == 123
+
+def test_stops_at_max_steps(tmp_path):
+    from hackemulator import HackEmulator
+    emulator = HackEmulator(assemble(tmp_path, ADD_LOOP))
+    # a run can stop in the middle of a block and continue from there:
+    for max_steps in range(7, 100_000, 7):
+        emulator.run(max_steps)
+        assert emulator.steps == max_steps or emulator.halted
+        if emulator.halted:
+            break
+    assert emulator.peek(2) == 123
+
+def test_signed_overflow(tmp_path):
+    from hackemulator import HackEmulator
+    # 32767 + 1 wraps around to -32768, which is < 0 for JLT:
+    emulator = HackEmulator(assemble(tmp_path, ['@32767', 'D=A', 'D=D+1', '@0', 'M=D', '@NEGATIVE', 'D;JLT',
+                                                '@1', 'M=-1', '(NEGATIVE)', '(HALT)', '@HALT', '0;JMP']))
+    emulator.run(1000)
+    assert emulator.peek(0) == -32768
+    assert emulator.peek(1) == 0
+
+def test_rom_image(tmp_path):
+    from hackemulator import load_hack_file, load_rom_image
+    machine_code = assemble(tmp_path, ADD_LOOP, rom_image = True)
+    assert load_rom_image(str(tmp_path / 'Test.rom')) == machine_code
+    assert load_hack_file(str(tmp_path / 'Test.hack')) == machine_code
@@ -0,0 +1,40 @@
+# Checks the peephole optimizer on small assembly programs: the
+# optimized program must leave the same RAM as the original one.
+
+def optimize(asm_lines, patterns=None):
+    from peephole import PeepholeOptimizer, PATTERNS
+    return PeepholeOptimizer(patterns or PATTERNS).optimize(asm_lines)
+
+def run_asm(folder, asm_lines):
+    from assembler import assembler_main
+    from hackemulator import HackEmulator
+    emulator = HackEmulator(assembler_main(str(folder / 'Test.asm'), asm_lines = asm_lines))
+    emulator.run(1000)
+    assert emulator.halted
+    return [emulator.peek(address) for address in range(16)]
+
+# A jump arrives at ENTRY with A holding the address of ENTRY, not R1.
+# The @R1 after the label is needed, although A holds R1 when the code
+# above the label falls through to it.
+JUMP_INTO_LABEL = ['@7', 'D=A', '@ENTRY', '0;JMP',
+                   '@R1', '(ENTRY)', '@R1', 'M=D',
+                   '(HALT)', '@HALT', '0;JMP']
+
+def test_jump_into_label(tmp_path):
+    optimized = optimize(JUMP_INTO_LABEL)
+    assert optimized[optimized.index('(ENTRY)') + 1] == '@R1'
+    assert run_asm(tmp_path, optimized) == run_asm(tmp_path, JUMP_INTO_LABEL)
+    assert run_asm(tmp_path, optimized)[1] == 7
+
+def test_loads_between_labels(tmp_path):
+    # without a label in between, the second @R4 and the first @R3 go:
+    optimized = optimize(['@R3', '@R4', 'M=1', '@R4', 'M=M+1', '(HALT)', '@HALT', '0;JMP'])
+    assert optimized == ['@R4', 'M=1', 'M=M+1', '(HALT)', '@HALT', '0;JMP']
+    assert run_asm(tmp_path, optimized)[4] == 2
+
+def test_templates_not_across_labels():
+    from peephole import PUSH_D, POP_D
+    # a pop that a jump can enter in the middle isn't removed:
+    asm_lines = list(PUSH_D) + ['(ENTRY)'] + list(POP_D) + ['@R5', 'M=D']
+    assert optimize(asm_lines, ['push_pop']) == asm_lines
+    assert optimize(list(PUSH_D) + list(POP_D) + ['@R5', 'M=D'], ['push_pop']) == ['@R5', 'M=D']
@@ -0,0 +1,114 @@
+# Builds the test programs with each option of the toolchain and checks
+# that the emulated program writes the same results as the build with no
+# options.
+
+import pytest
+
+from conftest import build, copy_program, run, run_machine_code, OUTPUT_WORDS
+
+PROGRAMS = ['basics', 'loops', 'folding', 'strings']
+
+# Output of each program (RAM[8000..]) built with no options:
+EXPECTED = {'basics': [135, 16, 14, 25, 4, 3, 8, 105, -1, 7, 55, -8, 42],
+            'loops': [62, 144, 2606],
+            'folding': [30, 56, 14, -7, -1, -303, -48, 224, -1, 6, 28, 0, 7],
+            'strings': [15450, 5, 123]}
+
+def all_patterns(module_name):
+    import importlib
+    return list(importlib.import_module(module_name).PATTERNS)
+
+# (name, jack_analyzer_main options, VMtranslator_main options):
+OPTION_SETS = [('fold_constants', {'fold_constants': True}, {}),
+               ('string_pool', {'string_pool': True}, {}),
+               ('streaming', {'streaming': True}, {}),
+               ('jobs', {'jobs': 2}, {}),
+               ('peephole', {}, {'peephole': all_patterns('peephole')}),
+               ('shared_calls', {}, {'shared_calls': True}),
+               ('remove_dead_functions', {}, {'remove_dead_functions': True}),
+               ('superinstructions', {}, {'superinstructions': all_patterns('superinstructions')}),
+               ('top_of_stack_in_d', {}, {'top_of_stack_in_d': True}),
+               ('inline', {}, {'inline': 500}),
+               ('inline_small_budget', {}, {'inline': 10}),
+               ('compare_branch', {'compare_branch': True}, {'compare_branch': True}),
+               ('all', {'fold_constants': True, 'string_pool': True, 'compare_branch': True},
+                {'peephole': all_patterns('peephole'), 'remove_dead_functions': True,
+                 'superinstructions': all_patterns('superinstructions'), 'top_of_stack_in_d': True,
+                 'inline': 500, 'compare_branch': True}),
+               ('all_shared_calls', {'fold_constants': True, 'compare_branch': True},
+                {'peephole': all_patterns('peephole'), 'shared_calls': True,
+                 'superinstructions': all_patterns('superinstructions'), 'inline': 500,
+                 'compare_branch': True})]
+
+@pytest.mark.parametrize('program', PROGRAMS)
+def test_baseline(program, baseline):
+    expected = EXPECTED[program] + [0] * (OUTPUT_WORDS - len(EXPECTED[program]))
+    assert baseline(program) == expected
+
+@pytest.mark.parametrize('name, jack_options, vm_options', OPTION_SETS, ids = [name for name, *_ in OPTION_SETS])
+@pytest.mark.parametrize('program', PROGRAMS)
+def test_options(program, name, jack_options, vm_options, baseline, tmp_path):
+    folder = copy_program(program, tmp_path / program)
+    assert run_machine_code(build(folder, jack_options, vm_options)) == baseline(program)
+
+@pytest.mark.parametrize('shared_calls', [False, True])
+@pytest.mark.parametrize('program', PROGRAMS)
+def test_os_bundle(program, shared_calls, baseline, tmp_path):
+    from jackanalyzer import jack_analyzer_main
+    from VMtranslator import VMtranslator_build_os_bundle
+    from osbundle import OSBundle
+    os_folder = copy_program('os', tmp_path / 'os', with_os = False)
+    jack_analyzer_main(os_folder, write_vm = True)
+    bundle_name = str(tmp_path / 'os.json')
+    VMtranslator_build_os_bundle(os_folder, bundle_name, shared_calls = shared_calls)
+    # the OS isn't in the program's folder, it is linked from the bundle:
+    folder = copy_program(program, tmp_path / program, with_os = False)
+    for remove_dead_functions in [False, True]:
+        vm_options = {'os_bundle': OSBundle(bundle_name, shared_calls = shared_calls),
+                      'shared_calls': shared_calls, 'remove_dead_functions': remove_dead_functions}
+        assert run_machine_code(build(folder, vm_options = vm_options)) == baseline(program)
+
+def test_cache(baseline, tmp_path):
+    from buildcache import BuildCache
+    folder = copy_program('basics', tmp_path / 'basics')
+    cache_dir = str(tmp_path / 'cache')
+    first = build(folder, cache = BuildCache(cache_dir))
+    second = build(folder, cache = BuildCache(cache_dir))
+    assert second == first
+    assert run_machine_code(second) == baseline('basics')
+    # a changed class is rebuilt, the others are reused and relinked:
+    with open(folder + '/Point.jack') as file:
+        source = file.read()
+    with open(folder + '/Point.jack', 'w') as file:
+        file.write(source.replace('return x;', 'return x + 1;'))
+    cached = build(folder, cache = BuildCache(cache_dir))
+    assert cached == build(folder)
+    assert run_machine_code(cached)[4] == baseline('basics')[4] + 1
+
+@pytest.mark.parametrize('program', PROGRAMS)
+def test_vm_interpreter(program, baseline, tmp_path):
+    from jackanalyzer import jack_analyzer_main
+    from vminterpreter import VMInterpreter, load_vm_files
+    folder = copy_program(program, tmp_path / program)
+    vm_sources = jack_analyzer_main(folder, write_vm = False)
+    assert run(VMInterpreter(load_vm_files(folder, vm_sources))) == baseline(program)
+
+def test_profiler(tmp_path):
+    from jackanalyzer import jack_analyzer_main
+    from VMtranslator import VMtranslator_main
+    from assembler import assembler_main
+    from hackemulator import HackEmulator
+    from profiler import Profiler
+    folder = copy_program('loops', tmp_path / 'loops')
+    asm_lines = VMtranslator_main(folder, vm_sources = jack_analyzer_main(folder, write_vm = False),
+                                  write_asm = False)
+    emulator = HackEmulator(assembler_main(folder + '.asm', asm_lines = asm_lines))
+    profiler = Profiler(asm_lines)
+    steps = profiler.run(emulator, 2_000_000)
+    assert sum(profiler.function_counts().values()) == steps
+    calls = profiler.call_counts()
+    assert calls[('bootstrap', 'Sys.init')] == 1
+    assert calls[('Main.main', 'Main.fib')] == 1
+    # fib(12) calls itself 2 * fib(13) - 2 times:
+    assert calls[('Main.fib', 'Main.fib')] == 2 * 233 - 2
+    assert calls[('Main.main', 'Math.divide')] == 40
@@ -0,0 +1,37 @@
+# Checks that StreamingJackTokenizer gives the same tokens as
+# JackTokenizer, and that both report the same errors.
+
+import glob
+import os
+
+import pytest
+
+from conftest import PROGRAMS_DIR
+
+JACK_FILES = sorted(glob.glob(os.path.join(PROGRAMS_DIR, '*', '*.jack')))
+
+def streamed_tokens(file_name):
+    from jacktokenizer import StreamingJackTokenizer
+    tokenizer = StreamingJackTokenizer(file_name)
+    tokens = [(tokenizer.token_type(), tokenizer.current_token)]
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        tokens.append((tokenizer.token_type(), tokenizer.current_token))
+    return tokens
+
+@pytest.mark.parametrize('file_name', JACK_FILES, ids = [os.path.relpath(name, PROGRAMS_DIR) for name in JACK_FILES])
+def test_streaming_tokens(file_name):
+    from jacktokenizer import JackTokenizer
+    assert streamed_tokens(file_name) == JackTokenizer(file_name).tokens_list
+
+@pytest.mark.parametrize('source, message', [('class Bad { /* never closed\n', 'Comment is never closed'),
+                                             ('class Bad { let s = "open; }\n', 'multi-line strings')])
+def test_errors(source, message, tmp_path):
+    from jacktokenizer import JackTokenizer
+    file_name = str(tmp_path / 'Bad.jack')
+    with open(file_name, 'w') as file:
+        file.write(source)
+    with pytest.raises(SyntaxError, match = message):
+        JackTokenizer(file_name)
+    with pytest.raises(SyntaxError, match = message):
+        streamed_tokens(file_name)